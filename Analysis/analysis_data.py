@@ -0,0 +1,137 @@
+import json
+import os
+import re
+from time import perf_counter
+
+import pandas as pd
+
+#problem sizes in the order the analysis scripts always concatenated their CSVs
+PROBLEMS = ["bummer", "disaster", "glitch"]
+LABELS = ["glitch", "bummer", "disaster"]
+IMAGE_TOOLS = ["DallE3", "GPTimage"]
+CACHE_DIR = ".analysis_cache"
+#bump when the table layout changes so older caches are rebuilt
+VERSION = 1
+
+CLASSIFIER_FILE = re.compile(r"Stats_summary_(?P<problem>[a-z]+)_combined_(?P<classifier>[A-Za-z0-9]+)_classify_(?P<modality>text|image|video)\.csv$")
+TIMINGS = {"Total_Time": "total_time", "Time_Script": "time_script", "Time_Image": "time_image", "Time_Voice": "time_voice", "Time_Video": "time_video"}
+LOGPROBS = {f"Logprob {label}": f"logprob_{label}" for label in LABELS}
+#columns the table keeps; the script text and file paths stay in the CSVs
+COLUMNS = ["scenario", "Image_Tool", "Problem Size", "Predicted Problem Size", "setting", *TIMINGS, *LOGPROBS]
+
+
+def source_files(folder: str = ".") -> list:
+    """(path, problem, classifier, modality) of every generation and classifier CSV; classifier is "" for the generation tables.
+    A generation table missing from folder is taken from {Problem}Folder/, where the generator writes it."""
+    sources=[]
+    names=sorted(os.listdir(folder))
+    for problem in PROBLEMS:
+        name=f"Stats_summary_{problem}_combined.csv"
+        path=os.path.join(folder, name)
+        if not os.path.exists(path):
+            path=os.path.join(folder, f"{problem.capitalize()}Folder", name)
+        if os.path.exists(path):
+            sources.append((path, problem, "", "generation"))
+    for name in names:
+        match=CLASSIFIER_FILE.match(name)
+        if match and match["problem"] in PROBLEMS:
+            sources.append((os.path.join(folder, name), match["problem"], match["classifier"], match["modality"]))
+    return sources
+
+
+def read_source(path: str, problem: str, classifier: str, modality: str) -> pd.DataFrame:
+    """One CSV as rows of the long table"""
+    df=pd.read_csv(path, dtype=str, usecols=lambda column: column.strip() in COLUMNS)
+    df.columns=df.columns.str.strip()
+    #some tables repeat their header line inside the data
+    df=df[df["scenario"]!="scenario"]
+    table=pd.DataFrame({
+        "source": path,
+        "problem": problem,
+        "scenario": pd.to_numeric(df["scenario"], errors="coerce").astype("Int32"),
+        "tool": df["Image_Tool"] if "Image_Tool" in df.columns else None,
+        "classifier": classifier or None,
+        "modality": modality,
+        "truth": df["Problem Size"].str.strip().str.lower(),
+        "prediction": df["Predicted Problem Size"].str.strip().str.lower() if "Predicted Problem Size" in df.columns else None,
+        "setting": df["setting"] if "setting" in df.columns else None,
+    })
+    for column, name in {**TIMINGS, **LOGPROBS}.items():
+        table[name]=pd.to_numeric(df[column], errors="coerce") if column in df.columns else float("nan")
+    return table
+
+
+def typed(table: pd.DataFrame) -> pd.DataFrame:
+    for column in ["source", "problem", "tool", "classifier", "modality", "setting"]:
+        table[column]=table[column].astype("category")
+    #truth and prediction share their categories so they can be compared with ==
+    answers=LABELS+sorted((set(table["truth"].dropna())|set(table["prediction"].dropna()))-set(LABELS))
+    for column in ["truth", "prediction"]:
+        table[column]=pd.Categorical(table[column], categories=answers)
+    return table.reset_index(drop=True)
+
+
+def load(folder: str = ".", use_cache: bool = True, verbose: bool = False) -> pd.DataFrame:
+    """Every generation and classifier CSV of folder as one long table: one row per generated (scenario, tool)
+    (modality "generation") and one per prediction, with problem, scenario, tool, classifier, modality, truth,
+    prediction, setting, the timings and, when present, the label log-probabilities.
+    The table is cached as Parquet; only CSVs whose modification time or size changed are read again."""
+    before=perf_counter()
+    sources=source_files(folder)
+    stamps={path: [os.stat(path).st_mtime_ns, os.path.getsize(path)] for path, *_ in sources}
+    cache_dir=os.path.join(folder, CACHE_DIR)
+    table_path=os.path.join(cache_dir, "long_table.parquet")
+    manifest_path=os.path.join(cache_dir, "manifest.json")
+    cached=None
+    manifest={}
+    if use_cache:
+        try:
+            with open(manifest_path) as f:
+                manifest=json.load(f)
+            if manifest.get("version")==VERSION:
+                cached=pd.read_parquet(table_path)
+        #ImportError: pandas has no Parquet engine (pyarrow or fastparquet), so the CSVs are read without a cache
+        except (OSError, ValueError, ImportError):
+            manifest={}
+    fresh={path for path, stamp in stamps.items() if cached is not None and manifest["files"].get(path)==stamp}
+    if cached is not None and fresh==set(stamps) and len(manifest["files"])==len(stamps):
+        if verbose:
+            print(f"Loaded {len(cached)} rows from {table_path} in {perf_counter()-before:.3f}s")
+        return cached
+    parts=[cached[cached["source"].isin(fresh)]] if fresh else []
+    parts+=[read_source(*source) for source in sources if source[0] not in fresh]
+    #keep the rows in source order whichever files came from the cache
+    order={path: number for number, (path, *_) in enumerate(sources)}
+    table=pd.concat([part.astype({"source": str}) for part in parts], ignore_index=True)
+    table=typed(table.sort_values("source", key=lambda paths: paths.map(order), kind="stable"))
+    if use_cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            table.to_parquet(f"{table_path}.tmp", index=False)
+            os.replace(f"{table_path}.tmp", table_path)
+            with open(manifest_path, "w") as f:
+                json.dump({"version": VERSION, "files": stamps}, f, indent=1)
+        except ImportError:
+            pass
+    if verbose:
+        print(f"Read {len(sources)-len(fresh)} of {len(sources)} CSVs into {len(table)} rows in {perf_counter()-before:.3f}s")
+    return table
+
+
+def generation(folder: str = ".", tool: str = None) -> pd.DataFrame:
+    """Rows of the generation tables, optionally of one image tool"""
+    table=load(folder)
+    rows=table[table["modality"]=="generation"]
+    return rows if tool is None else rows[rows["tool"]==tool]
+
+
+def predictions(classifier: str, modality: str, tool: str = None, folder: str = ".") -> pd.DataFrame:
+    """Predictions of one classifier ("cgpt", "gemini", ...) for one modality, optionally of one image tool"""
+    table=load(folder)
+    rows=table[(table["classifier"]==classifier) & (table["modality"]==modality)]
+    return rows if tool is None else rows[rows["tool"]==tool]
+
+
+if __name__ == "__main__":
+    table=load(verbose=True)
+    print(table.groupby(["modality", "classifier"], observed=True, dropna=False).size().to_string())
@@ -2,30 +2,21 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-# List of CSV files to load
-csv_files = [
-    "Stats_summary_bummer_combined.csv",
-    "Stats_summary_disaster_combined.csv",
-    "Stats_summary_glitch_combined.csv"
-]
+from analysis_data import generation
 
-# Load and combine data
-dfs = [pd.read_csv(file) for file in csv_files]
-df_all = pd.concat(dfs, ignore_index=True)
+# Generation rows of every problem size, one per scenario and image tool
+df_all = generation()
 
-# Box #1: Every other line in the "Script" column time
-script_times = df_all.loc[::2, "Time_Script"]  # Every other row
-script_times = pd.to_numeric(script_times, errors="coerce").dropna()  # Convert to numeric and drop NaN
+# Box #1: Script generation time, once per scenario (both image tools share the script)
+script_times = df_all.drop_duplicates(["problem", "scenario"])["time_script"].dropna()
 script_data = pd.DataFrame({"Modality": "Script", "Time": script_times})
 
-# Box #2: "Time_Image" where "Image_Tool" is "DallE3"
-dalle3_times = df_all.loc[df_all["Image_Tool"] == "DallE3", "Time_Image"]
-dalle3_times = pd.to_numeric(dalle3_times, errors="coerce").dropna()  # Convert to numeric and drop NaN
+# Box #2: Image generation time where the image tool is "DallE3"
+dalle3_times = df_all.loc[df_all["tool"] == "DallE3", "time_image"].dropna()
 dalle3_data = pd.DataFrame({"Modality": "DALL-E 3 Image", "Time": dalle3_times})
 
-# Box #3: "Time_Image" where "Image_Tool" is "GPTimage"
-gptimage_times = df_all.loc[df_all["Image_Tool"] == "GPTimage", "Time_Image"]
-gptimage_times = pd.to_numeric(gptimage_times, errors="coerce").dropna()  # Convert to numeric and drop NaN
+# Box #3: Image generation time where the image tool is "GPTimage"
+gptimage_times = df_all.loc[df_all["tool"] == "GPTimage", "time_image"].dropna()
 gptimage_data = pd.DataFrame({"Modality": "GPT-4o Image", "Time": gptimage_times})
 
 # Combine all data
@@ -2,41 +2,27 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-# List of CSV files for ChatGPT
-cgpt_csv_files = [
-    "Stats_summary_bummer_combined_cgpt_classify_text.csv",
-    "Stats_summary_disaster_combined_cgpt_classify_text.csv",
-    "Stats_summary_glitch_combined_cgpt_classify_text.csv"
-]
+from analysis_data import predictions
 
-# List of CSV files for Gemini
-gemini_csv_files = [
-    "Stats_summary_bummer_combined_gemini_classify_text.csv",
-    "Stats_summary_disaster_combined_gemini_classify_text.csv",
-    "Stats_summary_glitch_combined_gemini_classify_text.csv"
-]
-
-# Load and combine ChatGPT data
-cgpt_dfs = [pd.read_csv(file) for file in cgpt_csv_files]
-cgpt_df = pd.concat(cgpt_dfs, ignore_index=True)
-cgpt_df["Correctness"] = cgpt_df["Problem Size"] == cgpt_df["Predicted Problem Size"]
+# Text predictions of ChatGPT for every problem size
+cgpt_df = predictions("cgpt", "text").copy()
+cgpt_df["Correctness"] = cgpt_df["truth"] == cgpt_df["prediction"]
 cgpt_df["Correctness"] = cgpt_df["Correctness"].map({True: "Correct", False: "Incorrect"})
 cgpt_df["Modality"] = cgpt_df["Correctness"].map(
     {"Correct": "Correct (by GPT-4o)", "Incorrect": "Incorrect (by GPT-4o)"}
 )
 
-# Load and combine Gemini data
-gemini_dfs = [pd.read_csv(file) for file in gemini_csv_files]
-gemini_df = pd.concat(gemini_dfs, ignore_index=True)
-gemini_df["Correctness"] = gemini_df["Problem Size"] == gemini_df["Predicted Problem Size"]
+# Text predictions of Gemini for every problem size
+gemini_df = predictions("gemini", "text").copy()
+gemini_df["Correctness"] = gemini_df["truth"] == gemini_df["prediction"]
 gemini_df["Correctness"] = gemini_df["Correctness"].map({True: "Correct", False: "Incorrect"})
 gemini_df["Modality"] = gemini_df["Correctness"].map(
     {"Correct": "Correct (by Gemini)", "Incorrect": "Incorrect (by Gemini)"}
 )
 
 # Combine both datasets
-cgpt_df["Time"] = pd.to_numeric(cgpt_df["Time_Script"], errors="coerce")  # Ensure numeric values
-gemini_df["Time"] = pd.to_numeric(gemini_df["Time_Script"], errors="coerce")  # Ensure numeric values
+cgpt_df["Time"] = cgpt_df["time_script"]
+gemini_df["Time"] = gemini_df["time_script"]
 combined_df = pd.concat([cgpt_df[["Modality", "Time"]], gemini_df[["Modality", "Time"]]], ignore_index=True)
 
 # Calculate statistics for each modality
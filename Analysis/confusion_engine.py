@@ -0,0 +1,142 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis_data import LABELS, load
+
+DISPLAY_LABELS = ["Glitch", "Bummer", "Disaster"]
+#names used in the figure titles
+CLASSIFIER_TITLES = {"cgpt": "ChatGPT", "gemini": "Gemini", "local": "the Local Model"}
+TOOL_TITLES = {"DallE3": "DALL-E 3", "GPTimage": "GPT-4o"}
+#group of every image tool together; text predictions have no tool and only get this one
+ALL_TOOLS = "all"
+KEYS = ["classifier", "modality", "tool"]
+
+
+def count(table: pd.DataFrame = None, labels: list = LABELS) -> tuple:
+    """(groups, counts): one row of groups per (classifier, modality, tool) and counts[g, true, predicted] in labels order.
+    Every group is counted in one pass: the group, truth and prediction codes are folded into a single integer per row
+    and counted with np.bincount. Rows whose truth or prediction is not one of labels are left out, as in sklearn."""
+    table=load() if table is None else table
+    rows=table[table["modality"]!="generation"]
+    #per-tool groups plus the all-tools group of the image and video predictions
+    tools=rows["tool"].astype(object)
+    both=pd.concat([rows.assign(tool=tools.fillna(ALL_TOOLS)), rows[tools.notna()].assign(tool=ALL_TOOLS)], ignore_index=True)
+    grouped=both.groupby(KEYS, observed=True, sort=True)
+    codes=grouped.ngroup().to_numpy()
+    groups=grouped.size().index.to_frame(index=False).astype(str)
+    size=len(labels)
+    #analysis_data puts labels first in the categories of truth and prediction, so their codes are the label indices
+    assert list(both["truth"].cat.categories[:size])==labels
+    truth=both["truth"].cat.codes.to_numpy()
+    predicted=both["prediction"].cat.codes.to_numpy()
+    valid=(truth>=0)&(truth<size)&(predicted>=0)&(predicted<size)&(codes>=0)
+    flat=(codes[valid]*size+truth[valid])*size+predicted[valid]
+    counts=np.bincount(flat, minlength=len(groups)*size*size).reshape(len(groups), size, size)
+    return groups, counts
+
+
+def normalize(counts: np.ndarray) -> np.ndarray:
+    """Percentages of each true label's row; rows without examples stay NaN"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return counts.astype("float")/counts.sum(axis=-1, keepdims=True)*100
+
+
+def precision_recall(counts: np.ndarray) -> tuple:
+    """(precision, recall) per group and label"""
+    hits=np.diagonal(counts, axis1=-2, axis2=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return hits/counts.sum(axis=-2), hits/counts.sum(axis=-1)
+
+
+def matrices_frame(groups: pd.DataFrame, counts: np.ndarray, labels: list = LABELS) -> pd.DataFrame:
+    """Long table of every matrix: one row per (group, true label, predicted label) with its count and row percentage"""
+    size=len(labels)
+    frame=groups.loc[groups.index.repeat(size*size)].reset_index(drop=True)
+    frame["true"]=np.tile(np.repeat(labels, size), len(groups))
+    frame["predicted"]=np.tile(labels, len(groups)*size)
+    frame["count"]=counts.reshape(-1)
+    frame["percent"]=normalize(counts).reshape(-1).round(2)
+    return frame
+
+
+def metrics_frame(groups: pd.DataFrame, counts: np.ndarray, labels: list = LABELS) -> pd.DataFrame:
+    """Per-class precision, recall and support of every group, plus its accuracy"""
+    precision, recall = precision_recall(counts)
+    size=len(labels)
+    frame=groups.loc[groups.index.repeat(size)].reset_index(drop=True)
+    frame["label"]=np.tile(labels, len(groups))
+    frame["precision"]=precision.reshape(-1).round(4)
+    frame["recall"]=recall.reshape(-1).round(4)
+    frame["support"]=counts.sum(axis=-1).reshape(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        accuracy=np.trace(counts, axis1=-2, axis2=-1)/counts.sum(axis=(-2, -1))
+    frame["accuracy"]=np.repeat(accuracy, size).round(4)
+    return frame
+
+
+def save(groups: pd.DataFrame, counts: np.ndarray, output_dir: str = ".") -> list:
+    """confusion_matrices.csv, confusion_metrics.csv and confusion_matrices.npz (counts and percentages as group x true x predicted tensors)"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths=[os.path.join(output_dir, name) for name in ("confusion_matrices.csv", "confusion_metrics.csv", "confusion_matrices.npz")]
+    matrices_frame(groups, counts).to_csv(paths[0], index=False)
+    metrics_frame(groups, counts).to_csv(paths[1], index=False)
+    np.savez(paths[2], counts=counts, percent=normalize(counts), labels=np.array(LABELS),
+             **{key: groups[key].to_numpy(dtype=str) for key in KEYS})
+    return paths
+
+
+def find(groups: pd.DataFrame, classifier: str, modality: str, tool: str = None) -> int:
+    match=groups.index[(groups["classifier"]==classifier) & (groups["modality"]==modality) & (groups["tool"]==(tool or ALL_TOOLS))]
+    if len(match)==0:
+        raise KeyError(f"No predictions of {classifier}/{modality}/{tool or ALL_TOOLS}")
+    return match[0]
+
+
+def title(classifier: str, modality: str, tool: str = None) -> str:
+    what="Text" if modality=="text" else f"{TOOL_TITLES.get(tool, 'All')} {modality.capitalize()}s"
+    return f"Confusion Matrix of {what} Classified by {CLASSIFIER_TITLES.get(classifier, classifier)} (%)"
+
+
+def plot(percent: np.ndarray, figure_title: str):
+    """Row-normalized matrix drawn like sklearn's ConfusionMatrixDisplay, colour scale fixed to 0-100"""
+    from sklearn.metrics import ConfusionMatrixDisplay
+    import matplotlib.pyplot as plt
+    disp = ConfusionMatrixDisplay(confusion_matrix=percent, display_labels=DISPLAY_LABELS)
+    fig, ax = plt.subplots()
+    disp.plot(cmap='Blues', values_format=".2f", ax=ax)
+    ax.images[0].set_clim(0, 100)
+    plt.title(figure_title)
+    return fig
+
+
+def show_matrix(classifier: str, modality: str, tool: str = None, heading: str = None) -> np.ndarray:
+    """Plot one matrix and print it with percentage signs, as the combined_cm_* scripts do"""
+    import matplotlib.pyplot as plt
+    groups, counts = count()
+    percent=normalize(counts[find(groups, classifier, modality, tool)])
+    plot(percent, title(classifier, modality, tool))
+    plt.show()
+    print(heading or title(classifier, modality, tool))
+    print(np.array([[f"{value:.2f}%" for value in row] for row in percent]))
+    return percent
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Confusion matrices, precision and recall of every classifier, modality and image tool")
+    parser.add_argument("--output-dir", default="confusion")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    groups, counts = count()
+    for path in save(groups, counts, args.output_dir):
+        print(f"Saved: {path}")
+    metrics=metrics_frame(groups, counts)
+    print(metrics.pivot_table(index=KEYS, columns="label", values=["precision", "recall"], sort=False).round(3).to_string())
+
+if __name__ == "__main__":
+    main()
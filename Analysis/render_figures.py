@@ -0,0 +1,135 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import runpy
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import matplotlib
+#no display on the servers: render straight to files
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from analysis_data import load
+from confusion_engine import count, normalize, plot, title
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+FORMATS = ["png", "svg", "pdf"]
+DPI = 200
+MANIFEST = ".render_manifest.json"
+#boxplot script -> the rows of the long table it plots
+BOXPLOTS = {
+    "combined_bp_overview": lambda table: table["modality"]=="generation",
+    "combined_bp_text": lambda table: (table["modality"]=="text") & table["classifier"].isin(["cgpt", "gemini"]),
+    "combined_bp_DallE3": lambda table: (table["modality"]=="image") & table["classifier"].isin(["cgpt", "gemini"]) & (table["tool"]=="DallE3"),
+    "combined_bp_GPTimage": lambda table: (table["modality"]=="image") & table["classifier"].isin(["cgpt", "gemini"]) & (table["tool"]=="GPTimage"),
+}
+
+
+def data_hash(rows: pd.DataFrame, *extra: str) -> str:
+    """Hash of the values a figure is drawn from (not of the files they came from), plus whatever else shapes it"""
+    digest=hashlib.sha256(pd.util.hash_pandas_object(rows.drop(columns="source"), index=False).to_numpy().tobytes())
+    for text in extra:
+        digest.update(text.encode())
+    return digest.hexdigest()
+
+
+def source_text(name: str) -> str:
+    with open(os.path.join(ANALYSIS_DIR, f"{name}.py")) as f:
+        return f.read()
+
+
+def jobs(table: pd.DataFrame) -> dict:
+    """{figure name: (kind, argument, input hash)} of every boxplot and every confusion matrix"""
+    figures={}
+    #every figure is drawn from the table analysis_data builds, so a change to the loader redraws them all
+    settings=f"{DPI}{source_text('analysis_data')}"
+    for name, select in BOXPLOTS.items():
+        figures[name]=("script", name, data_hash(table[select(table)], source_text(name), settings))
+    groups, counts = count(table)
+    engine=source_text("confusion_engine")
+    for index, (classifier, modality, tool) in groups.iterrows():
+        figures[f"cm_{classifier}_{modality}_{tool}"]=("matrix", (classifier, modality, tool, counts[index].tolist()),
+                                                        hashlib.sha256(f"{counts[index].tolist()}{engine}{settings}".encode()).hexdigest())
+    return figures
+
+
+def render(name: str, kind: str, argument, output_dir: str, formats: list) -> tuple:
+    """Draw one figure in a worker process and save it in every format; a script's printed statistics go to <name>.txt"""
+    before=perf_counter()
+    plt.close("all")
+    if kind=="script":
+        with open(os.path.join(output_dir, f"{name}.txt"), "w") as log, contextlib.redirect_stdout(log):
+            #plt.show() does nothing on the Agg backend, so the script leaves its figure open for us
+            runpy.run_path(os.path.join(ANALYSIS_DIR, f"{argument}.py"), run_name="__main__")
+        fig=plt.gcf()
+    else:
+        classifier, modality, tool, counts = argument
+        fig=plot(normalize(np.array(counts)), title(classifier, modality, None if tool=="all" else tool))
+    for fmt in formats:
+        fig.savefig(os.path.join(output_dir, f"{name}.{fmt}"), dpi=DPI, bbox_inches="tight")
+    plt.close("all")
+    return name, perf_counter()-before
+
+
+def render_all(output_dir: str = "figures", formats: list = FORMATS, workers: int = None, force: bool = False, only: list = None) -> dict:
+    """Render every figure whose input hash changed since the last run (or whose files are missing); returns {name: seconds}"""
+    before=perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    #refresh the cached analysis table once here so the workers only read it
+    table=load()
+    figures=jobs(table)
+    if only:
+        figures={name: job for name, job in figures.items() if name in only}
+    manifest_path=os.path.join(output_dir, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest=json.load(f)
+    except (OSError, ValueError):
+        manifest={}
+    pending={name: job for name, job in figures.items()
+             if force or manifest.get(name)!=job[2] or not all(os.path.exists(os.path.join(output_dir, f"{name}.{fmt}")) for fmt in formats)}
+    print(f"{len(pending)} of {len(figures)} figures changed")
+    times={}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures={pool.submit(render, name, kind, argument, output_dir, formats): name for name, (kind, argument, _) in pending.items()}
+            for future in as_completed(futures):
+                name=futures[future]
+                try:
+                    name, seconds = future.result()
+                except Exception as e:
+                    print(f"{name} failed: {e}")
+                    manifest.pop(name, None)
+                    continue
+                times[name]=seconds
+                manifest[name]=pending[name][2]
+                print(f"Rendered {name} in {seconds:.2f}s")
+        tmp_path=f"{manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, manifest_path)
+    print(f"Done in {perf_counter()-before:.2f}s; figures in {output_dir}/")
+    return times
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render every boxplot and confusion matrix to files without a display, skipping figures whose data did not change")
+    parser.add_argument("--output-dir", default="figures")
+    parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS)
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="render every figure even if its data did not change")
+    parser.add_argument("--only", nargs="+", metavar="FIGURE", help="render only these figures, e.g. combined_bp_text cm_gemini_video_DallE3")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    render_all(args.output_dir, args.formats, args.workers, args.force, args.only)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
 
+import argparse
+import asyncio
+import hashlib
 import json
 import os
 import tempfile
-from time import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import perf_counter
 import pandas as pd
 import random
 import base64
+import subprocess
+import wave
+try:
+    import fcntl
+except ImportError:
+    #no advisory file locks on Windows; parallel runs there must keep to their own --run-name
+    fcntl=None
 
 import requests
 from dotenv import load_dotenv
@@ -16,6 +29,12 @@ from moviepy import (
 )
 
 from openai import OpenAI
+
+from api_calls import call_api
+from cache_tools import DiskLRU, SingleFlight
+from ffmpeg_tools import ffmpeg_exe
+from run_ledger import RunLedger, stats_csv_path
+from tracing import Tracer
 #load all the API key from the env file
 load_dotenv()
 
@@ -39,7 +58,7 @@ of the video; the image should have no text in it.
 # 
 
 def generate_script(client: OpenAI, prompt: str) -> str:
-    response = client.responses.create(
+    response = call_api("openai", "gpt-4o", client.responses.create,
         model="gpt-4o",
         input=[
             {"role": "system", "content": PROMPT},
@@ -81,7 +100,7 @@ def generate_script(client: OpenAI, prompt: str) -> str:
 
 ########## This is the DallE-3 image generation ###########
 def generate_image(client: OpenAI, prompt: str) -> str:
-    response = client.images.generate(
+    response = call_api("openai", "dall-e-3", client.images.generate,
         model="dall-e-3",
         prompt=prompt,
         size="1024x1024",
@@ -91,9 +110,9 @@ def generate_image(client: OpenAI, prompt: str) -> str:
 
     return response.data[0].url
 ########## This is the GPTimage image generation ###########
-def generate_image_GPTimage(client:OpenAI, prompt:str)->str:
+def generate_image_GPTimage(client:OpenAI, prompt:str)->bytes:
 
-    result = client.images.generate(
+    result = call_api("openai", "gpt-image-1", client.images.generate,
         model="gpt-image-1",
         prompt=prompt,
         size="1024x1024",
@@ -101,18 +120,54 @@ def generate_image_GPTimage(client:OpenAI, prompt:str)->str:
         n=1,
     )
     image_base64 = result.data[0].b64_json
-    image_bytes = base64.b64decode(image_base64)
+    # the decoded png is handed to the next stage in memory and only written once, as the final scenario image
+    return base64.b64decode(image_base64)
+
+
+class TTSCache:
+    """On-disk cache of synthesized speech keyed by (voice, text, format), evicting least recently used files above max_bytes.
+    Every path get() and put() return is held until release(), so a file a scenario still has to encode is never evicted."""
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder=folder
+        self.hits=0
+        self.misses=0
+        self._lock=threading.Lock()
+        self._files=DiskLRU(folder, max_bytes)
+
+    def path(self, voice: str, text: str, fmt: str) -> str:
+        key=hashlib.sha256(f"{voice}\0{fmt}\0{text}".encode("utf-8")).hexdigest()
+        return self._files.path(f"{key}.{fmt}")
+
+    def get(self, voice: str, text: str, fmt: str):
+        path=self.path(voice, text, fmt)
+        hit=self._files.get(path, hold=True)
+        with self._lock:
+            if hit:
+                self.hits+=1
+            else:
+                self.misses+=1
+        return path if hit else None
 
-    # Save the image to a file
-    path= os.path.join(os.getcwd(), "GPTimage.png")
-    with open(path, "wb") as f:
-        f.write(image_bytes)
-        f.close()
-    return path
+    def put(self, voice: str, text: str, fmt: str, content: bytes) -> str:
+        path=self.path(voice, text, fmt)
+        self._files.put(path, content, hold=True)
+        return path
+
+    def acquire(self, paths: list) -> None:
+        """Hold files that were not handed out by get() or put(), e.g. voiceovers resumed from the run manifest"""
+        self._files.acquire(paths)
+
+    def release(self, paths: list) -> None:
+        self._files.release(paths)
 
 
 #this is the LemonFox text to voice.
-def generate_voiceover_LF(voice:str,text:str,i)->str:
+def generate_voiceover_LF(voice:str,text:str,i,folder:str=None,cache:TTSCache=None)->str:
+    if cache is not None:
+        cached=cache.get(voice, text, "wav")
+        if cached:
+            return cached
     url = "https://api.lemonfox.ai/v1/audio/speech"
     headers = {
         "Authorization": os.getenv("Lemonfox_API_Key"),
@@ -124,10 +179,17 @@ def generate_voiceover_LF(voice:str,text:str,i)->str:
         "response_format": "wav"
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    def post():
+        response = requests.post(url, headers=headers, json=data)
+        response.raise_for_status()
+        return response
+
+    response = call_api("lemonfox", "tts", post)
+    if cache is not None:
+        return cache.put(voice, text, "wav", response.content)
   
    #LemonFox can't pass the url of response so the audio has been downloaded 
-    output_file = os.path.join(os.getcwd(), f"speech"+str(i)+".wav")
+    output_file = os.path.join(folder or os.getcwd(), f"speech"+str(i)+".wav")
 
     with open(output_file, "wb") as f:
         
@@ -137,90 +199,193 @@ def generate_voiceover_LF(voice:str,text:str,i)->str:
 
 
 
-def download_file(url: str, path: str) -> None:
-    response = requests.get(url)
+class Downloader:
+    """Keep-alive session that streams each URL to disk once per run and records bytes/time per scenario"""
+
+    def __init__(self, chunk_size: int = 64*1024, pool_size: int = 16):
+        self.session=requests.Session()
+        adapter=requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.chunk_size=chunk_size
+        #scenario -> [bytes, seconds]
+        self.stats={}
+        self._fetches=SingleFlight()
+        self._lock=threading.Lock()
+
+    def fetch(self, url: str, path: str, scenario=None) -> str:
+        """Download url to path and return the local file; a URL already fetched in this run returns its first path"""
+        return self._fetches.do(url, lambda: self._download(url, path, scenario))
+
+    def _download(self, url: str, path: str, scenario) -> str:
+        before=perf_counter()
+        size=0
+        tmp_path=f"{path}.part"
+        with self.session.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    size+=len(chunk)
+        os.replace(tmp_path, path)
+        with self._lock:
+            stats=self.stats.setdefault(scenario, [0, 0.0])
+            stats[0]+=size
+            stats[1]+=perf_counter()-before
+        return path
+
+def write_file(path: str, content: bytes) -> None:
     with open(path, "wb") as f:
-        f.write(response.content)
+        f.write(content)
 
-def copy_file(src: str, dest: str) -> None:
 
-    # importing the shutil module
-    import shutil
-    # create duplicate of the file at the destination with the name mentioned at the end of the destination path
-    path = shutil.copyfile(src,dest)
+def audio_duration(path: str) -> float:
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getnframes()/w.getframerate()
+    except (wave.Error, EOFError):
+        audio_clip=AudioFileClip(path)
+        duration=audio_clip.duration
+        audio_clip.close()
+        return duration
 
 
-def generate_video(movie: list[dict],i,p,tool,url) -> str:
+def encode_video_moviepy(scenes: list[tuple], output_path: str) -> None:
     clips = []
-    for index, scene in enumerate(movie):
-        image_url=url
-        #LemonFox can't pass the url of response so the audio has been downloaded earlier and can be used directly here
-        voiceover_url = scene["voiceover"]
-        image_path = os.path.join(os.getcwd(), f"scene_{index}.png")   
-        if tool=="DallE3":
-        ########code below is for DALLE-3
-            # Download the image from the URL
-            download_file(image_url, image_path)
-        else: #code is different for GPT4oimage due to different API response
-            image_path=image_url
-
+    for image_path, voiceover_url in scenes:
         audio_clip = AudioFileClip(voiceover_url)
         video_clip = ImageClip(image_path, duration=(int(audio_clip.duration) + 1))
         video_clip = video_clip.with_audio(audio_clip)
         clips.append(video_clip)
 
     final_video = concatenate_videoclips(clips)
-    final_video.write_videofile(os.path.join(os.getcwd(),f"./{p}Folder",f"video_{p}_{i}_{tool}.mp4"), fps=24, codec="libx264")
+    final_video.write_videofile(output_path, fps=24, codec="libx264")
     final_video.close()
 
-def add_row(filename,newlist):
-    from csv import writer
-    # Open our existing CSV file in append mode
-    # Create a file object for this file
-    with open(filename, 'a') as f_object:
-
-        # Pass this file object to csv.writer()
-        # and get a writer object
-        writer_object = writer(f_object)
-
-        # Pass the list as an argument into
-        # the writerow()
-        writer_object.writerow(newlist)
-
-        # Close the file object
-        f_object.close()
-
-def main():
-    #the proble size can be changed to disaster, bummer,or glitch. Each is run separately due to long processing time and unstability of DALLE3
-    problem_size="bummer".capitalize()
-    stats_columns=["scenario","Image_Tool","Total_Time","Time_Script","Time_Image","Time_Voice","Time_Video","Problem Size", "setting","Script"] 
-    print(os.getcwd())
-    #make folder
-
-    outputfolder=os.path.join(os.getcwd(),f"{problem_size}Folder")
-    os.makedirs(outputfolder, exist_ok=True) 
-    add_row(os.path.join(outputfolder,f"Stats_summary_{problem_size}_Combined.csv"),stats_columns)
-
 
-    #automatically read key from the env file
-    client = OpenAI()
-    #specifiy the number of scenarios to generate
-    n=1
-    #list of settings used to diversify the settings of the stories; if not used, GPT generates many duplicate scenarios on similar settings.
-    setting_list=['volleyball', 'soccer','running', 'basketball','class', 'curling', 'lacrosse', 'singing', 'dancing', 'art', 'after school club', 'birthday party','tryout', 'game', 'field trip', 'swimming','ski','tennis','playing video game','vacation']
-
-    for S_index in range(1,n+1):
-        #add timer
-        start_time=time()
-        #shuffle list
-        setting=setting_list[(S_index +random.randint(0,30)) % len(setting_list)]
-
-        print(f'Running {S_index} th scenario')
-        #add timer
-        before_script=time()
-        script = generate_script(
-            client,
-                prompt = f"""
+def encode_video_ffmpeg(scenes: list[tuple], output_path: str, fps: int) -> None:
+    """Hand the still images and voiceovers straight to ffmpeg instead of rendering every frame in Python"""
+    inputs=[]
+    filters=[]
+    streams=""
+    for index, (image_path, voiceover_url) in enumerate(scenes):
+        #same scene length as the moviepy path: the voiceover rounded down plus one second of silence
+        duration=int(audio_duration(voiceover_url)) + 1
+        inputs+=["-loop", "1", "-framerate", str(fps), "-t", str(duration), "-i", image_path, "-i", voiceover_url]
+        filters.append(f"[{2*index}:v]scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p,setsar=1[v{index}]")
+        filters.append(f"[{2*index+1}:a]apad,atrim=0:{duration},asetpts=N/SR/TB[a{index}]")
+        streams+=f"[v{index}][a{index}]"
+    filters.append(f"{streams}concat=n={len(scenes)}:v=1:a=1[v][a]")
+    command=[ffmpeg_exe(), "-y", "-loglevel", "error", *inputs,
+             "-filter_complex", ";".join(filters), "-map", "[v]", "-map", "[a]",
+             "-c:v", "libx264", "-tune", "stillimage", "-preset", "veryfast", "-r", str(fps),
+             "-c:a", "aac", "-movflags", "+faststart", output_path]
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def generate_video(movie: list[dict],i,p,tool,backend:str="moviepy",fps:int=1) -> str:
+    #images and voiceovers are local files by now: DALL-E 3 images are downloaded once right after generation
+    scenes = [(scene["image"], scene["voiceover"]) for scene in movie]
+
+    output_path=os.path.join(os.getcwd(),f"./{p}Folder",f"video_{p}_{i}_{tool}.mp4")
+    if backend=="ffmpeg":
+        try:
+            encode_video_ffmpeg(scenes, output_path, fps)
+            return output_path
+        except (OSError, subprocess.CalledProcessError) as e:
+            #moviepy stays as the fallback when ffmpeg is missing or rejects the input
+            stderr=getattr(e, "stderr", b"") or b""
+            print(f"ffmpeg encoding of {output_path} failed, falling back to moviepy: {e} {stderr.decode(errors='replace')}")
+    encode_video_moviepy(scenes, output_path)
+    return output_path
+
+class RunManifest:
+    """Append-only JSON lines log of the stages each scenario has finished, used to resume an interrupted run.
+    The file is locked for the life of the run, so a second run can neither truncate it nor write to it."""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path=path
+        self.stages={}
+        self.resumed=0
+        self._lock=threading.Lock()
+        self._file=open(path, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._file.close()
+                raise SystemExit(f"{path} is in use by another run; give parallel runs of one problem size their own --run-name")
+        if resume:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry=json.loads(line)
+                    except json.JSONDecodeError:
+                        #a line cut short by a crash
+                        continue
+                    self.stages.setdefault(entry["scenario"], {})[entry["stage"]]=entry
+        else:
+            self._file.truncate(0)
+
+    def claimed(self) -> list:
+        """Scenario numbers the interrupted run had claimed, finished or not"""
+        return sorted(scenario for scenario in self.stages if scenario>0)
+
+    def get(self, scenario: int, stage: str):
+        """The recorded entry of a finished stage, or None if it has to run (again)"""
+        entry=self.stages.get(scenario, {}).get(stage)
+        if entry is None:
+            return None
+        #a stage only counts as done while the artifacts it produced are still on disk
+        paths=entry.get("paths", [])+([entry["path"]] if "path" in entry else [])
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        with self._lock:
+            self.resumed+=1
+        return entry
+
+    def record(self, scenario: int, stage: str, **data) -> None:
+        entry={"scenario": scenario, "stage": stage, **data}
+        with self._lock:
+            self.stages.setdefault(scenario, {})[stage]=entry
+            self._file.write(json.dumps(entry)+"\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+#list of settings used to diversify the settings of the stories; if not used, GPT generates many duplicate scenarios on similar settings.
+SETTING_LIST=['volleyball', 'soccer','running', 'basketball','class', 'curling', 'lacrosse', 'singing', 'dancing', 'art', 'after school club', 'birthday party','tryout', 'game', 'field trip', 'swimming','ski','tennis','playing video game','vacation']
+
+SPECIAL_INSTRUCTION="draw in cartoon style a picture with 4 panels and same main charactor for the whole story. No words should be displayed. Incident needs to be clearly visualized. Facial expressions should match script"
+
+IMAGE_TOOLS=["DallE3","GPTimage"]
+
+#default number of concurrent calls allowed for each stage of the pipeline
+STAGE_LIMITS={"script": 4, "image": 4, "voice": 8, "video": 2}
+
+
+@dataclass
+class GenerationRun:
+    """Everything the stages of one generation run share"""
+    client: OpenAI
+    problem_size: str
+    outputfolder: str
+    limits: dict
+    tts_cache: TTSCache = None
+    video_backend: str = "ffmpeg"
+    video_fps: int = 1
+    downloader: Downloader = None
+    manifest: RunManifest = None
+    ledger: RunLedger = None
+    tracer: Tracer = None
+
+
+def scenario_prompt(setting: str, problem_size: str) -> str:
+    return f"""
 Tell a short, realistic incident that triggers negative emotions for someone aged 5 to 18 using specific information below. 
 The story will be presented to a child to ask him to identify the size of the problem. Randomly choose their name and gender. 
 Radomly select one setting from the list below. The story ends when the problem present itself but not been solved yet and the character asking himself:
@@ -236,76 +401,280 @@ examples of bummer are Group disagreement, missing homework, misunderstanding wi
 glitch: Minor annoyance that will pass with time or quickly fixed.
 
   """
-        )
-        after_script=time()
-        time_script=after_script-before_script
-        #save the total script for output later
-        totalscript=''
-        for j in range(len(script['scenes'])):
-            imagescript=totalscript+script['scenes'][j]["image"]
-            totalscript+=script['scenes'][j]["text"]
-
-        special_instruction="draw in cartoon style a picture with 4 panels and same main charactor for the whole story. No words should be displayed. Incident needs to be clearly visualized. Facial expressions should match script"
-        before_D3_image=time()
-        #call DALLE3 to generate image based on image script and special instruction
-        image_url_DallE3 = generate_image(client, imagescript+special_instruction)
-        after_D3_image=time()
-        #call GPTimage to generate image based on the same image script and special instruction
-        image_url_GPTimage=generate_image_GPTimage(client, imagescript+special_instruction)
-        after_image=time()
-        time_D3_image=after_D3_image-before_D3_image
-        time_GPT_image=after_image-after_D3_image
-        time_voice=0
-        i=0
-        #combine voice and image to generate video
-        for imagetool in ["DallE3","GPTimage"]:
-            movie = []
-            print(f'working on {imagetool} for scenario {S_index}')
-            for scene in script["scenes"]:
-                before_voice=time()
-                voiceover_url = generate_voiceover_LF("Sarah", scene["text"],i)
-                after_voice=time()
-                time_voice+=after_voice-before_voice
-                i=i+1
-                if imagetool=="DallE3":
-                    image_url=image_url_DallE3
+
+
+async def generate_images(run: GenerationRun, prompt: str, S_index: int, tools: list) -> dict:
+    """Run the given image tools concurrently; returns {tool: (image, seconds)} for the tools that succeeded,
+    where image is a URL for DallE3 and the png bytes for GPTimage"""
+    async def timed(tool, fn, *args):
+        #each tool gets its own lane in the trace since the two calls overlap
+        with run.tracer.track(S_index, tool):
+            async with run.limits["image"]:
+                with run.tracer.span("image", tool=tool) as span:
+                    image = await asyncio.to_thread(fn, run.client, prompt, *args)
+                return image, span.seconds
+
+    generators={
+        "DallE3": lambda: timed("DallE3", generate_image),
+        "GPTimage": lambda: timed("GPTimage", generate_image_GPTimage),
+    }
+    calls={tool: generators[tool]() for tool in tools}
+    results=await asyncio.gather(*calls.values(), return_exceptions=True)
+    images={}
+    for tool, result in zip(calls, results):
+        if isinstance(result, Exception):
+            print(f"[Scenario {S_index}] {tool} image generation failed: {result}")
+        else:
+            images[tool]=result
+    return images
+
+
+async def run_scenario(run: GenerationRun, S_index: int) -> None:
+    """Generate script, images, voice and videos for one scenario; each stage is gated by its own semaphore
+    and skipped when the manifest shows it finished in an earlier attempt"""
+    client, problem_size, outputfolder, limits, manifest = run.client, run.problem_size, run.outputfolder, run.limits, run.manifest
+    if manifest.get(S_index, "rows"):
+        print(f"[Scenario {S_index}] already complete, skipping")
+        return
+    #intermediate files of the scenario (uncached voiceovers) live in their own temp folder, removed when it finishes
+    #cached voiceovers the scenario uses are held in the TTS cache until its videos are encoded
+    held=[]
+    with run.tracer.track(S_index), run.tracer.span("scenario", problem_size=problem_size), \
+            tempfile.TemporaryDirectory(prefix=f"{problem_size}_{S_index}_") as workdir:
+        try:
+            await _run_scenario(run, S_index, workdir, held)
+        finally:
+            if run.tts_cache is not None:
+                run.tts_cache.release(held)
+
+
+async def _run_scenario(run: GenerationRun, S_index: int, workdir: str, held: list) -> None:
+    client, problem_size, outputfolder, limits, manifest, tracer = run.client, run.problem_size, run.outputfolder, run.limits, run.manifest, run.tracer
+    #add timer
+    start_time=perf_counter()
+    #recorded time of stages reused from an earlier attempt still counts towards Total_Time
+    reused=0.0
+
+    print(f'Running {S_index} th scenario')
+    done=manifest.get(S_index, "script")
+    if done:
+        setting, script, time_script = done["setting"], done["script"], done["time"]
+        reused+=time_script
+    else:
+        #shuffle list
+        setting=SETTING_LIST[(S_index +random.randint(0,30)) % len(SETTING_LIST)]
+        async with limits["script"]:
+            with tracer.span("script", setting=setting) as span:
+                script = await asyncio.to_thread(generate_script, client, scenario_prompt(setting, problem_size))
+        time_script=span.seconds
+        manifest.record(S_index, "script", setting=setting, script=script, time=time_script)
+    #save the total script for output later
+    totalscript=''
+    for j in range(len(script['scenes'])):
+        imagescript=totalscript+script['scenes'][j]["image"]
+        totalscript+=script['scenes'][j]["text"]
+
+    images={}
+    for tool in IMAGE_TOOLS:
+        done=manifest.get(S_index, f"image:{tool}")
+        if done:
+            images[tool]=(done["path"], done["time"])
+    if images:
+        reused+=max(time_image for _, time_image in images.values())
+    #DallE3 and GPTimage are started together; a tool that fails is dropped without losing the other one
+    generated=await generate_images(run, imagescript+SPECIAL_INSTRUCTION, S_index, [tool for tool in IMAGE_TOOLS if tool not in images])
+    for tool, (image, time_image) in generated.items():
+        #save the images to be analyzed later; the video reuses the saved file
+        image_path=os.path.join(outputfolder,f"scenario_{problem_size}_{S_index}_{tool}.png")
+        try:
+            with tracer.track(S_index, tool), tracer.span("save image"):
+                if tool=="DallE3":
+                    #DALL-E 3 returns a URL: fetch it once straight to the saved png
+                    image_path=await asyncio.to_thread(run.downloader.fetch, image, image_path, S_index)
                 else:
-                    image_url=image_url_GPTimage
-                movie.append(
-                    {
-                        "image": image_url,
-                        "voiceover": voiceover_url,
-                    }
-                )
-            before_video=time()
-            #generate the video based on the script and image and save it as mp4 files to be analyzed later
-            generate_video(movie,S_index,problem_size,imagetool,image_url)
-            after_video=time()
-            time_video=after_video-before_video
-            total_time=after_video-start_time
-
-            #generate the stats for this scenario and add to csv file
-
-            print(totalscript)
-            if imagetool=="DallE3":
-                time_image=time_D3_image
-            else:
-                time_image=time_GPT_image
-           
-            newlist=[S_index,imagetool, format(total_time, '.2f'),format(time_script,'.2f'), format(time_image,'.2f'), format(time_voice,'.2f'), format(time_video,'.2f'),problem_size, setting, totalscript]
-            #now output stats and lables
-            add_row(os.path.join(outputfolder,f"Stats_summary_{problem_size}_combined.csv"),newlist)
-
-            #next we need to save the images to be analyzed later
-            
-            image_path = os.path.join(outputfolder,f"scenario_{problem_size}_{S_index}_{imagetool}.png")
-            if imagetool=="GPTimage":
-                copy_file(image_url, image_path)
-            else:
-                download_file(image_url, image_path)
-            
+                    await asyncio.to_thread(write_file, image_path, image)
+        except Exception as e:
+            print(f"[Scenario {S_index}] {tool} image could not be saved: {e}")
+            continue
+        manifest.record(S_index, f"image:{tool}", path=image_path, time=time_image)
+        images[tool]=(image_path, time_image)
+    if not images:
+        raise RuntimeError(f"no image tool succeeded for scenario {S_index}")
+    #keep the DallE3, GPTimage order of the stats rows
+    images={tool: images[tool] for tool in IMAGE_TOOLS if tool in images}
+
+    i=0
+    rows=[]
+    #combine voice and image to generate video
+    for imagetool, (image_url, time_image) in images.items():
+        print(f'working on {imagetool} for scenario {S_index}')
+        done=manifest.get(S_index, f"voice:{imagetool}")
+        if done and run.tts_cache is not None:
+            #hold the resumed voiceovers, then make sure no other scenario evicted them in the meantime
+            run.tts_cache.acquire(done["paths"])
+            held+=done["paths"]
+            if not all(os.path.exists(path) for path in done["paths"]):
+                done=None
+        if done:
+            voiceovers=done["paths"]
+            #voice time of this tool's pass only, not accumulated over the tools before it
+            time_voice=done["time"]
+            reused+=done["time"]
+            i+=len(voiceovers)
+        else:
+            voiceovers=[]
+            time_voice=0
+            with tracer.track(S_index, imagetool), tracer.span("voice"):
+                for index, scene in enumerate(script["scenes"]):
+                    async with limits["voice"]:
+                        with tracer.span("tts", scene=index) as span:
+                            voiceovers.append(await asyncio.to_thread(generate_voiceover_LF, "Sarah", scene["text"], i, workdir, run.tts_cache))
+                    held.append(voiceovers[-1])
+                    time_voice+=span.seconds
+                    i=i+1
+            manifest.record(S_index, f"voice:{imagetool}", paths=voiceovers, time=time_voice)
+        movie = [{"image": image_url, "voiceover": voiceover_url} for voiceover_url in voiceovers]
+
+        done=manifest.get(S_index, f"video:{imagetool}")
+        if done:
+            time_video=done["time"]
+            total_time=done["total_time"]
+            #the next tool's Total_Time includes this video, as in an uninterrupted run; the recorded total also
+            #holds the waits of the earlier attempt, so the next tool counts on from it
+            reused+=done["time"]
+            reused=max(reused, total_time-(perf_counter()-start_time))
+        else:
+            async with limits["video"]:
+                #generate the video based on the script and image and save it as mp4 files to be analyzed later
+                with tracer.track(S_index, imagetool), tracer.span("video", backend=run.video_backend) as span:
+                    video_path=await asyncio.to_thread(generate_video, movie, S_index, problem_size, imagetool, run.video_backend, run.video_fps)
+            time_video=span.seconds
+            total_time=perf_counter()-start_time+reused
+            manifest.record(S_index, f"video:{imagetool}", path=video_path, time=time_video, total_time=total_time)
+
+        print(totalscript)
+        rows.append({"problem_size": problem_size.lower(), "scenario": S_index, "image_tool": imagetool, "total_time": total_time, "time_script": time_script,
+                     "time_image": time_image, "time_voice": time_voice, "time_video": time_video, "setting": setting, "script": totalscript})
+
+    downloaded, time_download=run.downloader.stats.get(S_index, (0, 0.0))
+    print(f"[Scenario {S_index}] downloaded {downloaded} bytes in {time_download:.2f}s")
+
+    #now output stats and lables
+    run.ledger.add_rows(rows)
+    manifest.record(S_index, "rows", tools=list(images))
+
+
+def scenario_numbers(run: GenerationRun, n: int):
+    """The n scenarios of this run: those an interrupted attempt had claimed, then new numbers, each reserved
+    in the ledger when a worker picks it up and recorded in the manifest so --resume finishes it"""
+    claimed=run.manifest.claimed()
+    yield from claimed[:n]
+    for _ in range(n-len(claimed)):
+        S_index=run.ledger.claim_scenario(run.problem_size.lower(), run.manifest.path)
+        run.manifest.record(S_index, "claim")
+        yield S_index
+
+
+async def run_all(run: GenerationRun, n: int, concurrency: int, stage_limits: dict) -> None:
+    """Run n scenarios with at most `concurrency` scenarios in flight"""
+    run.limits={stage: asyncio.Semaphore(limit) for stage, limit in stage_limits.items()}
+    #blocking API calls run in worker threads; size the pool so it never becomes the bottleneck
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=sum(stage_limits.values())+concurrency))
+    #a fixed set of workers pulls from one shared iterator so thousands of scenarios never become thousands of pending tasks
+    indices=scenario_numbers(run, n)
+
+    async def worker():
+        for S_index in indices:
+            try:
+                await run_scenario(run, S_index)
+            except Exception as e:
+                if concurrency==1:
+                    raise
+                print(f"[Scenario {S_index}] Failed: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate scenario scripts, images and videos for a given problem size")
+    #the proble size can be changed to disaster, bummer,or glitch. Each is run separately due to long processing time and unstability of DALLE3
+    parser.add_argument("--problem", default="bummer", choices=["glitch", "bummer", "disaster"])
+    #specifiy the number of scenarios to generate
+    parser.add_argument("-n", "--num-scenarios", type=int, default=1)
+    #number of scenarios generated at the same time; 1 runs them one after another
+    parser.add_argument("--concurrency", type=int, default=1)
+    for stage, limit in STAGE_LIMITS.items():
+        parser.add_argument(f"--{stage}-limit", type=int, default=limit, help=f"max concurrent {stage} calls")
+    #synthesized speech is reused across image tools and runs; the cache is trimmed to this size, sparing the files of scenarios still in flight
+    parser.add_argument("--tts-cache-dir", default=os.path.join(os.getcwd(), ".tts_cache"))
+    parser.add_argument("--tts-cache-mb", type=int, default=500)
+    parser.add_argument("--no-tts-cache", action="store_true")
+    #ffmpeg encodes the still image directly at a low frame rate; moviepy renders every frame and is kept as the fallback
+    parser.add_argument("--video-backend", default="ffmpeg", choices=["ffmpeg", "moviepy"])
+    parser.add_argument("--video-fps", type=int, default=1, help="frame rate of the ffmpeg backend")
+    #write the stage spans of the run as a Chrome/Perfetto trace (open in chrome://tracing or ui.perfetto.dev)
+    parser.add_argument("--trace", help="path of the trace json")
+    #stats rows go to this SQLite ledger and are exported to {Problem}Folder/Stats_summary_{problem}_combined.csv at the end
+    parser.add_argument("--ledger", default=os.path.join(os.getcwd(), "run_ledger.sqlite"))
+    #continue an interrupted run: stages recorded in the run manifest are skipped and their saved artifacts reused
+    parser.add_argument("--resume", action="store_true")
+    #runs of the same problem size in parallel each need their own name, which is the name of their manifest
+    parser.add_argument("--run-name", default="", help="manifest_{Problem}_{name}.jsonl instead of manifest_{Problem}.jsonl")
+    return parser.parse_args()
+
+
+def main():
+    args=parse_args()
+    problem_size=args.problem.capitalize()
+    print(os.getcwd())
+    #make folder
+
+    outputfolder=os.path.join(os.getcwd(),f"{problem_size}Folder")
+    os.makedirs(outputfolder, exist_ok=True) 
+    manifest=RunManifest(os.path.join(outputfolder, f"manifest_{problem_size}{'_'+args.run_name if args.run_name else ''}.jsonl"), args.resume)
+
+
+    #automatically read key from the env file; retries are handled by call_api
+    client = OpenAI(max_retries=0)
+    stage_limits={stage: getattr(args, f"{stage}_limit") for stage in STAGE_LIMITS}
+    if args.concurrency==1:
+        #serial run: one call at a time, except the two image tools of a scenario which always run together
+        stage_limits={stage: 1 for stage in STAGE_LIMITS}
+        stage_limits["image"]=2
+    tts_cache=None if args.no_tts_cache else TTSCache(args.tts_cache_dir, args.tts_cache_mb*1024*1024)
+    run=GenerationRun(client, problem_size, outputfolder, {}, tts_cache, args.video_backend, args.video_fps, Downloader(), manifest, RunLedger(args.ledger), Tracer())
+    stats_csv=stats_csv_path(args.problem)
+    #rows already in the summary (e.g. the committed ones) are kept, and this run's scenarios are numbered after them
+    imported=run.ledger.import_csv(args.problem, stats_csv)
+    if imported:
+        print(f"{imported} existing rows of {stats_csv} added to the ledger")
+    print(f"Generating {args.num_scenarios} scenarios, numbered after those in {args.ledger}")
+    try:
+        asyncio.run(run_all(run, args.num_scenarios, args.concurrency, stage_limits))
+    finally:
+        #the csv holds every row of this problem size: earlier runs, other processes and the rows it already had
+        if run.ledger.rows(args.problem):
+            print(f"{run.ledger.export_csv(args.problem, stats_csv)} rows exported to {stats_csv}")
+        run.ledger.close()
+        manifest.close()
+        if args.trace:
+            run.tracer.export(args.trace)
+            print(f"Trace written to {args.trace}")
+        print_summary(run)
+
+
+def print_summary(run: GenerationRun) -> None:
+    print("Run summary:")
+    if run.tts_cache is not None:
+        print(f"  TTS cache: {run.tts_cache.hits} hits, {run.tts_cache.misses} misses")
+    downloaded=sum(stats[0] for stats in run.downloader.stats.values())
+    time_download=sum(stats[1] for stats in run.downloader.stats.values())
+    print(f"  Downloads: {downloaded} bytes in {time_download:.2f}s")
+    if run.manifest.resumed:
+        print(f"  Resumed: {run.manifest.resumed} stages reused from {run.manifest.path}")
+
 
 
 if __name__ == "__main__":
 #    for j in range (5): 
-        main()
\ No newline at end of file
+        main()
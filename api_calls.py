@@ -0,0 +1,148 @@
+import email.utils
+import os
+import random
+import threading
+from time import monotonic, sleep, time
+
+from tracing import add_wait
+
+#requests per minute allowed for each (provider, model); override with e.g. RATE_LIMIT_OPENAI_GPT_4O=300
+#defaults sit at or just below the usual tier-1 quotas so parallel runs stay under the ceiling
+DEFAULT_LIMITS = {
+    ("openai", "gpt-4o"): 500,
+    ("openai", "dall-e-3"): 7,
+    ("openai", "gpt-image-1"): 5,
+    ("lemonfox", "tts"): 60,
+    ("gemini", "gemini-1.5-pro-latest"): 150,
+    ("gemini", "gemini-2.0-flash"): 1000,
+    ("gemini", "upload"): 300,
+    ("gemini", "files"): 600,
+}
+#used for any (provider, model) not listed above
+FALLBACK_LIMIT = 60
+
+#retry policy of call_api: delays grow as BASE_DELAY*2**attempt, capped at MAX_DELAY
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+#HTTP status codes worth retrying; everything else (400, 401, 403, 404, ...) is fatal
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+#exception class names of connection problems and timeouts across requests, httpx, openai and google-api-core
+RETRYABLE_NAMES = {
+    "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout", "ChunkedEncodingError",
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "TooManyRequests", "RemoteDisconnected",
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at per_minute/60 tokens per second"""
+
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate=per_minute/60.0
+        #a small burst keeps the first calls fast without overshooting the per-minute quota
+        self.capacity=burst if burst is not None else max(1.0, min(per_minute/6.0, 10.0))
+        self.tokens=self.capacity
+        self.updated=monotonic()
+        self.paused_until=0.0
+        self._lock=threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now=monotonic()
+                self.tokens=min(self.capacity, self.tokens+(now-self.updated)*self.rate)
+                self.updated=now
+                if now>=self.paused_until and self.tokens>=1:
+                    self.tokens-=1
+                    return
+                wait=max(self.paused_until-now, (1-self.tokens)/self.rate)
+            sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller of this bucket, e.g. after the provider answered 429"""
+        with self._lock:
+            self.paused_until=max(self.paused_until, monotonic()+seconds)
+            self.tokens=0
+
+
+_buckets={}
+_buckets_lock=threading.Lock()
+
+
+def bucket_for(provider: str, model: str) -> TokenBucket:
+    with _buckets_lock:
+        bucket=_buckets.get((provider, model))
+        if bucket is None:
+            env_name=f"RATE_LIMIT_{provider}_{model}".upper().replace("-", "_").replace(".", "_")
+            per_minute=float(os.getenv(env_name, DEFAULT_LIMITS.get((provider, model), FALLBACK_LIMIT)))
+            bucket=_buckets[(provider, model)]=TokenBucket(per_minute)
+        return bucket
+
+
+def configure_limit(provider: str, model: str, per_minute: float, burst: float = None) -> None:
+    with _buckets_lock:
+        _buckets[(provider, model)]=TokenBucket(per_minute, burst)
+
+
+def status_code(exc: Exception):
+    """HTTP status of an error raised by requests, openai or google-api-core, if any"""
+    for value in (getattr(exc, "status_code", None), getattr(getattr(exc, "response", None), "status_code", None), getattr(exc, "code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    status=status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_NAMES for cls in type(exc).__mro__)
+
+
+def retry_after(exc: Exception):
+    """Seconds the provider asked us to wait (Retry-After / retry-after-ms), if it said so"""
+    headers=getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"])/1000
+        value=headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp()-time())
+    except (TypeError, ValueError):
+        return None
+
+
+def call_api(provider: str, model: str, fn, /, *args, **kwargs):
+    """Call fn(*args, **kwargs) under the (provider, model) rate limit, retrying retryable errors
+    with jittered exponential backoff that honors Retry-After"""
+    bucket=bucket_for(provider, model)
+    attempt=0
+    while True:
+        before_wait=monotonic()
+        bucket.acquire()
+        #report time spent queued so stage timings can exclude it
+        add_wait(monotonic()-before_wait)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt>=MAX_RETRIES or not is_retryable(e):
+                raise
+            delay=retry_after(e)
+            if delay is None:
+                #full jitter: spread retries of parallel workers instead of retrying in lockstep
+                delay=random.uniform(0, min(MAX_DELAY, BASE_DELAY*2**attempt))
+            if status_code(e)==429 or type(e).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+                #the quota is exhausted for everyone, not just this worker
+                bucket.pause(delay)
+            attempt+=1
+            print(f"{provider}/{model} call failed ({type(e).__name__}: {e}); retry {attempt}/{MAX_RETRIES} in {delay:.1f}s")
+            sleep(delay)
+            add_wait(delay)
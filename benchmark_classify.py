@@ -0,0 +1,132 @@
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+import google.generativeai as genai
+import pandas as pd
+from openai import OpenAI
+
+from classify_all import (LABELS, build_items, cgpt_classify_image, gemini_classify_image, gemini_classify_video,
+                          gemini_classify_video_keyframes, load_scenarios)
+from gemini_uploads import UploadManager
+from image_preprocess import ImageSettings, preprocess
+from video_keyframes import video_parts
+
+#longest sides compared against the original PNGs (1024x1024)
+DEFAULT_SIZES = [768, 512, 384, 256]
+#variant every other variant of the same provider is compared with
+BASELINES = {"image": "original", "video": "upload"}
+OUTPUTS = {"image": "image_size_benchmark.csv", "video": "video_mode_benchmark.csv"}
+
+
+def image_variants(providers: list, sizes: list, fmt: str, quality: int, constrained: bool):
+    """Variants of an image benchmark: the original PNG and a resized, re-encoded copy per size, each sent to every provider"""
+    settings=[None]+[ImageSettings(size, fmt, quality) for size in sizes]
+    classifiers={}
+    if "cgpt" in providers:
+        client=OpenAI(max_retries=0)
+        classifiers["cgpt"]=lambda path, uploads: cgpt_classify_image(client, path, constrained)
+    if "gemini" in providers:
+        genai.configure()
+        classifiers["gemini"]=lambda path, uploads: gemini_classify_image(path, uploads, constrained)
+
+    def variants(path: str, uploads: UploadManager):
+        for setting in settings:
+            before=perf_counter()
+            sent=preprocess(path, setting)
+            prepare=perf_counter()-before
+            for provider, classify in classifiers.items():
+                yield provider, setting.name if setting else "original", lambda: classify(sent, uploads), os.path.getsize(sent), prepare
+    return variants
+
+
+def video_variants(constrained: bool):
+    """Variants of a video benchmark: Gemini on the uploaded MP4 and on its keyframes + soundtrack sent inline"""
+    genai.configure()
+
+    def variants(path: str, uploads: UploadManager):
+        yield "gemini", "upload", lambda: gemini_classify_video(path, uploads, constrained), os.path.getsize(path), 0.0
+        before=perf_counter()
+        payload=sum(len(part["data"]) for part in video_parts(path))
+        prepare=perf_counter()-before
+        yield "gemini", "keyframes", lambda: gemini_classify_video_keyframes(path, constrained), payload, prepare
+    return variants
+
+
+def benchmark(modality: str, problems: list, limit: int, variants) -> pd.DataFrame:
+    """Classify the first limit items of every problem size once per variant; one row per (item, provider, variant)"""
+    rows=[]
+    with tempfile.TemporaryDirectory() as tmp:
+        #a fresh upload index so every upload is timed instead of reusing handles from earlier runs
+        uploads=UploadManager(os.path.join(tmp, "uploads.json"))
+        for problem in problems:
+            df=load_scenarios(problem)
+            items=list(build_items(df, problem, modality).items())[:limit]
+            for index, path in items:
+                truth=str(df.at[index, "Problem Size"]).lower()
+                for provider, variant, classify, size, prepare in variants(path, uploads):
+                    before=perf_counter()
+                    try:
+                        predicted_size=str(classify())
+                    except Exception as e:
+                        print(f"[{provider}/{variant}] {os.path.basename(path)} failed: {e}")
+                        predicted_size="Error"
+                    seconds=perf_counter()-before
+                    print(f"[{provider}/{variant}] {os.path.basename(path)}: {predicted_size} in {seconds:.2f}s ({size/1e3:.0f} kB)")
+                    rows.append({"problem": problem, "item": os.path.basename(path), "provider": provider, "variant": variant,
+                                 "bytes_sent": size, "seconds": round(seconds, 3), "local_prepare_seconds": round(prepare, 3),
+                                 "Problem Size": truth, "Predicted Problem Size": predicted_size})
+        uploads.close()
+    return pd.DataFrame(rows)
+
+
+def summarize(results: pd.DataFrame, baseline: str) -> pd.DataFrame:
+    results=results.assign(valid=results["Predicted Problem Size"].isin(LABELS),
+                           correct=results["Predicted Problem Size"]==results["Problem Size"])
+    summary=results.groupby(["provider", "variant"], sort=False).agg(items=("item", "count"), valid=("valid", "sum"), accuracy=("correct", "mean"),
+                                                                     mean_seconds=("seconds", "mean"), median_seconds=("seconds", "median"),
+                                                                     p90_seconds=("seconds", lambda seconds: seconds.quantile(0.9)),
+                                                                     mean_kb_sent=("bytes_sent", lambda size: size.mean()/1e3))
+    #how often a variant gave the same answer as the baseline for the same item and provider
+    answers=results.pivot_table(index=["problem", "item", "provider"], columns="variant", values="Predicted Problem Size", aggfunc="first")
+    if baseline in answers.columns:
+        agreement={}
+        for (provider, variant) in summary.index:
+            same=answers.xs(provider, level="provider")
+            agreement[(provider, variant)]=(same[variant]==same[baseline]).mean()
+        summary[f"agreement_with_{baseline}"]=pd.Series(agreement)
+        base=summary.xs(baseline, level="variant")
+        summary["payload_ratio"]=summary["mean_kb_sent"]/base["mean_kb_sent"].reindex(summary.index.get_level_values("provider")).values
+    return summary.round(3)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare classification latency, bytes sent and accuracy of the ways an item can be sent: "
+                                                 "images at their original size or resized and re-encoded, videos as an MP4 upload or as keyframes + soundtrack")
+    parser.add_argument("--mode", required=True, choices=["image", "video"])
+    parser.add_argument("--problems", nargs="+", default=["glitch", "bummer", "disaster"], choices=["glitch", "bummer", "disaster"])
+    parser.add_argument("--providers", nargs="+", default=["cgpt", "gemini"], choices=["cgpt", "gemini"], help="image mode only; videos are classified by Gemini")
+    parser.add_argument("--limit", type=int, default=10, help="items per problem size")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="image mode: longest sides in pixels to compare with the original")
+    parser.add_argument("--image-format", default="jpeg", choices=["jpeg", "webp"])
+    parser.add_argument("--image-quality", type=int, default=85)
+    parser.add_argument("--constrained", action="store_true")
+    parser.add_argument("--output", default=None, help="per-item results (default: image_size_benchmark.csv or video_mode_benchmark.csv)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.mode=="image":
+        variants=image_variants(args.providers, args.sizes, args.image_format, args.image_quality, args.constrained)
+    else:
+        variants=video_variants(args.constrained)
+    output=args.output or OUTPUTS[args.mode]
+    results=benchmark(args.mode, args.problems, args.limit, variants)
+    results.to_csv(output, index=False)
+    print(summarize(results, BASELINES[args.mode]).to_string())
+    print(f"Per-item results saved to: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Callable
+
+
+class DiskLRU:
+    """Files of one cache folder, evicting the least recently used above max_bytes. A held file (hold=True,
+    or acquire() until release()) is never evicted, so a caller can keep using a path it was handed."""
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder=folder
+        self.max_bytes=max_bytes
+        self._lock=threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        #path -> size, least recently used first; the folder is only scanned once
+        entries=sorted((entry for entry in os.scandir(folder) if entry.is_file() and not entry.name.endswith(".tmp")), key=lambda entry: entry.stat().st_mtime)
+        self._entries=OrderedDict((entry.path, entry.stat().st_size) for entry in entries)
+        self._size=sum(self._entries.values())
+        #path -> number of holders that have not released it yet
+        self._refs={}
+        self._evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def get(self, path: str, hold: bool = False) -> bool:
+        """Whether path is in the cache; a hit counts as recently used"""
+        with self._lock:
+            if not os.path.exists(path):
+                return False
+            #touch the file so later runs see it as recently used too
+            os.utime(path)
+            if path not in self._entries:
+                #written by another process since the folder was scanned
+                self._entries[path]=os.path.getsize(path)
+                self._size+=self._entries[path]
+            self._entries.move_to_end(path)
+            if hold:
+                self._hold(path)
+            return True
+
+    def put(self, path: str, content: bytes, hold: bool = False) -> None:
+        #write to a temp name first so a concurrent reader never sees a partial file
+        tmp_path=f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._size+=len(content)-self._entries.pop(path, 0)
+            self._entries[path]=len(content)
+            if hold:
+                self._hold(path)
+            self._evict(keep=path)
+
+    def acquire(self, paths: list) -> None:
+        """Hold files that were not handed out with hold=True, e.g. paths resumed from an earlier run"""
+        with self._lock:
+            for path in paths:
+                self._hold(path)
+
+    def release(self, paths: list) -> None:
+        """Drop one hold on each path; a file nobody holds can be evicted again"""
+        with self._lock:
+            for path in paths:
+                refs=self._refs.get(path, 0)-1
+                if refs>0:
+                    self._refs[path]=refs
+                else:
+                    self._refs.pop(path, None)
+            self._evict()
+
+    def _hold(self, path: str) -> None:
+        self._refs[path]=self._refs.get(path, 0)+1
+
+    def _evict(self, keep: str = None) -> None:
+        if self._size<=self.max_bytes:
+            return
+        evicted=[]
+        size=self._size
+        for path, file_size in self._entries.items():
+            if size<=self.max_bytes:
+                break
+            if path not in self._refs and path!=keep:
+                evicted.append(path)
+                size-=file_size
+        for path in evicted:
+            self._size-=self._entries.pop(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class SingleFlight:
+    """Does the work for a key once even when several threads ask for it at the same time: the others wait for
+    the same Future. With remember, a finished result is handed out again for the rest of the run; a failure is
+    always forgotten so a later call can try again."""
+
+    def __init__(self, remember: bool = True):
+        self.remember=remember
+        self._futures={}
+        self._lock=threading.Lock()
+
+    def submit(self, key, work: Callable, executor: Executor = None) -> Future:
+        """Future of key's result, starting work (on executor, else in this thread) unless it is already in flight"""
+        with self._lock:
+            future=self._futures.get(key)
+            if future is not None:
+                return future
+            future=self._futures[key]=Future()
+        if executor is None:
+            self._run(key, work, future)
+        else:
+            executor.submit(self._run, key, work, future)
+        return future
+
+    def do(self, key, work: Callable):
+        return self.submit(key, work).result()
+
+    def _run(self, key, work: Callable, future: Future) -> None:
+        try:
+            result=work()
+        except Exception as e:
+            with self._lock:
+                del self._futures[key]
+            future.set_exception(e)
+            return
+        if not self.remember:
+            with self._lock:
+                del self._futures[key]
+        future.set_result(result)
@@ -0,0 +1,211 @@
+import argparse
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from classify_all import (CACHE_PATH, DEFAULT_PROVIDERS, LABELS, PROVIDERS, PROVIDER_WORKERS, Progress, build_items, classify_items,
+                          close_default_uploads, format_output, load_scenarios, log, make_backends, script_groups, text_rows)
+from prediction_cache import PredictionCache
+
+#cheapest first: a scenario only reaches the next stage when the evidence so far is not confident enough
+STAGES = ["text", "image", "video"]
+#thresholds the --evaluate report compares
+DEFAULT_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99]
+
+
+def fuse(predictions: list) -> tuple:
+    """(label, confidence, agreement) of several predictions of one scenario. Confidence is the label's
+    probability averaged over the predictions; agreement is the share of predictions that chose it.
+    Without a usable prediction (every call failed) the label is None."""
+    probs=dict.fromkeys(LABELS, 0.0)
+    for predicted_size in predictions:
+        logprobs=getattr(predicted_size, "logprobs", None)
+        if logprobs:
+            for label, logprob in logprobs.items():
+                probs[label]+=math.exp(logprob)
+        elif predicted_size in probs:
+            #a provider without logprobs counts as certain of its answer
+            probs[predicted_size]+=1.0
+    if not any(probs.values()):
+        return None, 0.0, 0.0
+    label=max(probs, key=probs.get)
+    return label, probs[label]/max(len(predictions), 1), sum(predicted_size==label for predicted_size in predictions)/max(len(predictions), 1)
+
+
+def confident(fused: tuple, threshold: float, min_agreement: float) -> bool:
+    _, confidence, agreement = fused
+    return confidence>=threshold and agreement>=min_agreement
+
+
+class Cascade:
+    """Runs the stages of one problem size: classifies the script text of every scenario, then the images and
+    videos of only the scenarios a stage asks for. Predictions are kept per scenario so thresholds can be replayed."""
+
+    def __init__(self, problem: str, providers: list, pool: ThreadPoolExecutor, cache: PredictionCache, progress: Progress):
+        self.problem=problem
+        self.df=load_scenarios(problem)
+        #rows of the repeated header line some summaries contain carry no ground truth
+        self.df=self.df[self.df["Problem Size"].str.lower().isin(LABELS)].reset_index(drop=True)
+        self.pool=pool
+        self.cache=cache
+        self.progress=progress
+        self.backends={stage: make_backends(providers, [stage], constrained=True) for stage in STAGES}
+        self.items={stage: build_items(self.df, problem, stage) for stage in STAGES}
+        #a script is classified once and its prediction joined to every row that shares it
+        self.groups=script_groups(self.df)
+        #scenario -> stage -> list of predictions
+        self.predictions={}
+
+    def scenarios(self) -> list:
+        return list(dict.fromkeys(self.df["scenario"]))
+
+    def classify(self, stage: str, scenarios: set) -> None:
+        items={index: item for index, item in self.items[stage].items() if self.df.at[index, "scenario"] in scenarios}
+        futures=[]
+        for backend in self.backends[stage]:
+            self.progress.add(backend.name, len(items))
+            futures+=[self.pool.submit(classify_items, backend, self.df, {index: item}, self.progress, self.cache) for index, item in items.items()]
+        for future in futures:
+            for index, predicted_size in future.result().items():
+                if predicted_size=="Error":
+                    continue
+                rows=self.groups[index] if stage=="text" else [index]
+                for scenario in dict.fromkeys(self.df.loc[rows, "scenario"]):
+                    self.predictions.setdefault(scenario, {}).setdefault(stage, []).append(predicted_size)
+
+    def evidence(self, scenario, last_stage: str) -> list:
+        """All predictions of a scenario up to and including last_stage"""
+        stages=STAGES[:STAGES.index(last_stage)+1]
+        return [predicted_size for stage in stages for predicted_size in self.predictions.get(scenario, {}).get(stage, [])]
+
+    def decide(self, threshold: float, min_agreement: float) -> dict:
+        """{scenario: (stage reached, label, confidence)} for predictions that are already there"""
+        decisions={}
+        for scenario in self.scenarios():
+            for stage in STAGES:
+                fused=fuse(self.evidence(scenario, stage))
+                if confident(fused, threshold, min_agreement) or stage==STAGES[-1]:
+                    break
+            decisions[scenario]=(stage, fused[0], fused[1])
+        return decisions
+
+    def run(self, threshold: float, min_agreement: float) -> dict:
+        """Classify lazily: a stage only sees the scenarios the earlier stages were not confident about"""
+        pending=set(self.scenarios())
+        for stage in STAGES:
+            self.classify(stage, pending)
+            pending={scenario for scenario in pending if not confident(fuse(self.evidence(scenario, stage)), threshold, min_agreement)}
+            log(f"[{self.problem}] {stage}: {len(pending)} scenarios escalated")
+            if not pending:
+                break
+        return self.decide(threshold, min_agreement)
+
+    def truth(self) -> dict:
+        return {scenario: size.lower() for scenario, size in zip(self.df["scenario"], self.df["Problem Size"])}
+
+    def calls(self, stage: str, scenarios) -> int:
+        """API calls a stage makes for the given scenarios"""
+        scenarios=set(scenarios)
+        return len(self.backends[stage])*sum(self.df.at[index, "scenario"] in scenarios for index in self.items[stage])
+
+    def escalation_calls(self, decisions: dict) -> tuple:
+        """(image/video calls the decisions needed, image/video calls of running every stage)"""
+        calls=full_calls=0
+        for stage in STAGES[1:]:
+            #a scenario pays for a stage when it stopped at that stage or a later one
+            reached=[scenario for scenario, decision in decisions.items() if STAGES.index(decision[0])>=STAGES.index(stage)]
+            calls+=self.calls(stage, reached)
+            full_calls+=self.calls(stage, decisions)
+        return calls, full_calls
+
+    def write(self, decisions: dict) -> str:
+        text_items=self.items["text"]
+        rows=text_rows(self.df, self.groups)
+        #a scenario none of the stages could classify is written as "Error", like a failed call in classify_all
+        predictions={index: decisions[self.df.at[index, "scenario"]][1] or "Error" for index in rows}
+        df=format_output(self.df, "text", text_items, predictions, rows=list(rows))
+        position=df.columns.get_loc("Predicted Problem Size")+1
+        df.insert(position, "Cascade Stage", [decisions[scenario][0] for scenario in df["scenario"]])
+        df.insert(position+1, "Confidence", [round(decisions[scenario][2], 4) for scenario in df["scenario"]])
+        output_file=f"Stats_summary_{self.problem}_combined_cascade.csv"
+        df.to_csv(output_file, index=False)
+        return output_file
+
+
+def report(cascades: list, thresholds: list, min_agreement: float) -> pd.DataFrame:
+    """Stage mix, API calls avoided and accuracy of each threshold next to always stopping after text
+    (threshold 0) and always running every stage (threshold above 1). Scenarios without any prediction
+    are left out of the accuracy and counted under no_prediction."""
+    rows=[]
+    for threshold in [0.0]+sorted(thresholds)+[1.01]:
+        stages={stage: 0 for stage in STAGES}
+        correct=total=missing=calls=full_calls=0
+        for cascade in cascades:
+            truth=cascade.truth()
+            #the text-only baseline stops after text even when the providers disagree
+            decisions=cascade.decide(threshold, min_agreement if threshold>0 else 0.0)
+            for scenario, (stage, label, _) in decisions.items():
+                stages[stage]+=1
+                if label is None:
+                    missing+=1
+                    continue
+                correct+=label==truth[scenario]
+                total+=1
+            needed, full=cascade.escalation_calls(decisions)
+            calls+=needed
+            full_calls+=full
+        rows.append({"threshold": "text only" if threshold==0 else "all stages" if threshold>1 else threshold,
+                     **{f"stopped_{stage}": count for stage, count in stages.items()},
+                     "escalation_calls": calls, "escalation_calls_avoided": full_calls-calls,
+                     "no_prediction": missing, "accuracy": round(correct/max(total, 1), 4)})
+    table=pd.DataFrame(rows)
+    table["accuracy_cost"]=(table["accuracy"].iloc[-1]-table["accuracy"]).round(4)
+    return table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify scenarios text first and escalate to image, then video, only when the answer is uncertain")
+    parser.add_argument("--problems", nargs="+", default=["glitch", "bummer", "disaster"], choices=["glitch", "bummer", "disaster"])
+    parser.add_argument("--providers", nargs="+", default=DEFAULT_PROVIDERS, choices=PROVIDERS,
+                        help="adding local lets the offline text model settle the confident scenarios before any API call")
+    parser.add_argument("--threshold", type=float, default=0.9, help="label probability a stage needs to stop the cascade")
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="share of the predictions that must agree to stop the cascade")
+    parser.add_argument("--evaluate", nargs="*", type=float, metavar="THRESHOLD",
+                        help="classify every stage for every scenario and report calls avoided and accuracy for these thresholds")
+    parser.add_argument("--workers", type=int, default=sum(PROVIDER_WORKERS.values()))
+    parser.add_argument("--cache", default=CACHE_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cache=PredictionCache(args.cache)
+    progress=Progress()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            cascades=[Cascade(problem, args.providers, pool, cache, progress) for problem in args.problems]
+            if args.evaluate is not None:
+                for cascade in cascades:
+                    for stage in STAGES:
+                        cascade.classify(stage, set(cascade.scenarios()))
+                table=report(cascades, args.evaluate or DEFAULT_THRESHOLDS, args.min_agreement)
+                output_file=f"cascade_report_{'_'.join(args.problems)}.csv"
+                table.to_csv(output_file, index=False)
+                print(table.to_string(index=False))
+                print(f"Report saved to: {output_file}")
+            else:
+                for cascade in cascades:
+                    decisions=cascade.run(args.threshold, args.min_agreement)
+                    stopped={stage: sum(decision[0]==stage for decision in decisions.values()) for stage in STAGES}
+                    calls, full_calls=cascade.escalation_calls(decisions)
+                    log(f"[{cascade.problem}] stopped at {stopped}; {full_calls-calls} of {full_calls} image/video calls avoided")
+                    log(f"Predictions saved to: {cascade.write(decisions)}")
+    finally:
+        progress.update("", final=True)
+        log(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
+        cache.close()
+        close_default_uploads()
+
+if __name__ == "__main__":
+    main()
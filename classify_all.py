@@ -0,0 +1,770 @@
+import argparse
+import base64
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable
+
+import pandas as pd
+import google.generativeai as genai
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from api_calls import call_api, status_code
+from gemini_uploads import UploadManager
+from image_preprocess import ImageSettings, image_mime, preprocess
+from prediction_cache import DEFAULT_MAX_AGE_DAYS, DEFAULT_MAX_ENTRIES, PredictionCache, file_hash, text_hash
+from result_journal import ResultJournal
+from video_keyframes import video_parts
+
+# Load all the keys from the .env file
+load_dotenv()
+
+PROMPT_INTRO = {
+    "text": "You will read a short story about a child experiencing a social problem. ",
+    "image": "You will view an image telling a short story about a child experiencing a social problem. ",
+    "video": "You will view a video telling a short story about a child experiencing a social problem. ",
+}
+
+PROMPT_GUIDE = """Identify the main problem in the story and classify it into one of three categories based on its size.
+
+Classify the problem as one of the following categories: 
+   Problem Size Guide:
+    disaster: Posing serious risk to personal health or safety or lost of lives of close friends or family members, or suffer from large financial loss, or require significant help from
+        others and long time to recover
+    bummer: Disappointing, medium size problems that can't be quickly fixed, may needs time and effort or help from others to solve it over time, not serious, this category is between glitch and disaster
+        examples of bummer are Group disagreement, missing homework, misunderstanding with a friend, parent or teacher.
+    glitch: Minor annoyance that will pass with time or quickly fixed.
+"""
+
+PROMPT_ANSWER = """
+Return only one word — “disaster”, “bummer”, or “glitch” — in lowercase.
+Do not include any explanation or extra text/symbols such as quotation marks.
+"""
+
+#the same prompts the per-provider classifier scripts have always used
+PROMPTS = {modality: "\n" + intro + "\n" + PROMPT_GUIDE + PROMPT_ANSWER for modality, intro in PROMPT_INTRO.items()}
+
+#batched text mode: several stories per request, answered as JSON with one label per story ID
+BATCH_PROMPT = "\n" + "You will read several short stories, each about a child experiencing a social problem. Each story starts with its ID. " + "\n" + PROMPT_GUIDE + """
+Classify every story separately. Answer with one entry per story ID, whose label is "disaster", "bummer", or "glitch".
+"""
+
+#keyframe video mode: the MP4 is replaced by its distinct frames and its soundtrack
+KEYFRAME_NOTE = "The video is given as its distinct frames in order, followed by its narration audio.\n"
+
+LABELS = ["glitch", "bummer", "disaster"]
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "labels": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "label": {"type": "string", "enum": LABELS}},
+                "required": ["id", "label"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["labels"],
+    "additionalProperties": False,
+}
+
+PROVIDERS = ["cgpt", "gemini", "local"]
+#the API providers; "local" (local_classifier.py) needs a trained model, so it only runs when asked for
+DEFAULT_PROVIDERS = ["cgpt", "gemini"]
+#default number of calls each provider has in flight at once; Gemini's upload + inference path is heavier
+#and the local model predicts whole batches on the CPU
+PROVIDER_WORKERS = {"cgpt": 8, "gemini": 4, "local": 2}
+MODALITIES = ["text", "image", "video"]
+IMAGE_TOOLS = ["GPTimage", "DallE3"]
+CACHE_PATH = "prediction_cache.sqlite"
+#scenario table rows classified per wave; even, so the two image-tool rows of a scenario stay together
+CHUNK_SIZE = 1000
+#columns the constrained mode adds after "Predicted Problem Size"
+LOGPROB_COLUMNS = [f"Logprob {label}" for label in LABELS]
+#tokens per answer position the constrained mode asks OpenAI for (the API maximum)
+TOP_LOGPROBS = 20
+
+
+class Label(str):
+    """A predicted label that also carries {label: log-probability} of the answer, when the provider returned them"""
+
+    def __new__(cls, label: str, logprobs: dict = None):
+        obj=super().__new__(cls, label)
+        obj.logprobs=logprobs or {}
+        return obj
+
+
+def label_logprobs(candidates: list) -> dict:
+    """{label: log-probability} from the (token, logprob) candidates of the first answer token.
+    The labels start with different letters, so every candidate that is a prefix of a label counts for that label."""
+    probs={}
+    for token, logprob in candidates:
+        token=token.strip().strip("\"'").lower()
+        for label in LABELS:
+            if token and label.startswith(token):
+                probs[label]=probs.get(label, 0.0)+math.exp(logprob)
+    return {label: math.log(prob) for label, prob in probs.items()}
+
+
+def pick_label(candidates: list) -> Label:
+    logprobs=label_logprobs(candidates)
+    if not logprobs:
+        raise ValueError(f"no label among the most likely tokens {[token for token, _ in candidates[:5]]}")
+    return Label(max(logprobs, key=logprobs.get), logprobs)
+
+
+def cgpt_constrained(client: OpenAI, messages: list) -> Label:
+    """One-token GPT-4o answer; the label is the most probable of glitch/bummer/disaster among the top tokens"""
+    response = call_api("openai", "gpt-4o", client.chat.completions.create,
+        model="gpt-4o",
+        messages=messages,
+        max_tokens=1,
+        logprobs=True,
+        top_logprobs=TOP_LOGPROBS,
+    )
+    return pick_label([(candidate.token, candidate.logprob) for candidate in response.choices[0].logprobs.content[0].top_logprobs])
+
+
+def cgpt_classify_text(client: OpenAI, story: str, constrained: bool = False) -> str:
+    """
+    Use ChatGPT to classify the size of the problem for a given story.
+    """
+    if constrained:
+        return cgpt_constrained(client, [
+            {"role": "system", "content": PROMPTS["text"]},
+            {"role": "user", "content": story},
+        ])
+    response = call_api("openai", "gpt-4o", client.responses.create,
+        model="gpt-4o",
+        input=[
+            {"role": "system", "content": PROMPTS["text"]},
+            {"role": "user", "content": story},
+        ],
+    )
+    return response.output_text.strip().lower()
+
+
+def batch_message(stories: dict) -> str:
+    return "\n\n".join(f"ID: {story_id}\n{story}" for story_id, story in stories.items())
+
+
+def parse_batch(text: str, stories: dict) -> dict:
+    """{story ID: label} of a batched answer; raises ValueError unless every story got exactly one valid label"""
+    labels={}
+    for entry in json.loads(text)["labels"]:
+        story_id, label = str(entry["id"]), str(entry["label"]).strip().lower()
+        if story_id not in stories or story_id in labels or label not in LABELS:
+            raise ValueError(f"unexpected entry {entry}")
+        labels[story_id]=label
+    if len(labels)!=len(stories):
+        raise ValueError(f"{len(stories)-len(labels)} of {len(stories)} stories have no label")
+    return labels
+
+
+def cgpt_classify_text_batch(client: OpenAI, stories: dict) -> dict:
+    """Classify several stories ({story ID: text}) with one GPT-4o request whose output is held to BATCH_SCHEMA"""
+    response = call_api("openai", "gpt-4o", client.chat.completions.create,
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": BATCH_PROMPT},
+            {"role": "user", "content": batch_message(stories)},
+        ],
+        response_format={"type": "json_schema", "json_schema": {"name": "problem_sizes", "strict": True, "schema": BATCH_SCHEMA}},
+    )
+    return parse_batch(response.choices[0].message.content, stories)
+
+
+def encode_image(image_path: str) -> str:
+    """Encode image as base64 string for OpenAI API"""
+    with open(image_path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+def cgpt_classify_image(client: OpenAI, image_path: str, constrained: bool = False) -> str:
+    """Use GPT-4o to classify the size of the problem from an image"""
+    base64_image = encode_image(image_path)
+    messages=[
+        {"role": "system", "content": PROMPTS["image"]},
+        {"role": "user", "content": [
+            {"type": "text", "text": "Here is the image."},
+            {"type": "image_url", "image_url": {
+                "url": f"data:{image_mime(image_path)};base64,{base64_image}"
+            }},
+        ]}
+    ]
+    if constrained:
+        return cgpt_constrained(client, messages)
+    response = call_api("openai", "gpt-4o", client.chat.completions.create,
+        model="gpt-4o",
+        messages=messages,
+        max_tokens=10
+    )
+    return response.choices[0].message.content.strip().lower()
+
+
+#models that rejected response_logprobs; their constrained answers come without probabilities
+_no_logprobs=set()
+
+
+def gemini_constrained(model_name: str, contents: list) -> Label:
+    """Gemini answer restricted to one of LABELS by an enum response schema, with logprobs where the model offers them"""
+    model = genai.GenerativeModel(model_name=model_name)
+    config={"response_mime_type": "text/x.enum", "response_schema": {"type": "string", "enum": LABELS}}
+    response=None
+    if model_name not in _no_logprobs:
+        try:
+            response = call_api("gemini", model_name, model.generate_content, contents,
+                generation_config={**config, "response_logprobs": True, "logprobs": len(LABELS)})
+        except Exception as e:
+            if status_code(e)!=400:
+                raise
+            print(f"{model_name} does not return logprobs ({e}); continuing without them")
+            _no_logprobs.add(model_name)
+    if response is None:
+        response = call_api("gemini", model_name, model.generate_content, contents, generation_config=config)
+    label=response.text.strip().lower()
+    if label not in LABELS:
+        raise ValueError(f"unexpected answer {response.text!r}")
+    try:
+        candidates=response.candidates[0].logprobs_result.top_candidates[0].candidates
+        logprobs=label_logprobs([(candidate.token, candidate.log_probability) for candidate in candidates])
+    except (AttributeError, IndexError):
+        logprobs={}
+    return Label(label, logprobs)
+
+
+def gemini_classify_text(script_text: str, constrained: bool = False) -> str:
+    """Classify the problem size based on the text using Gemini API."""
+    contents=[
+        {"text": PROMPTS["text"]},  # System prompt
+        {"text": script_text}  # User input
+    ]
+    if constrained:
+        return gemini_constrained("gemini-1.5-pro-latest", contents)
+    model = genai.GenerativeModel(model_name="gemini-1.5-pro-latest")
+    response = call_api("gemini", "gemini-1.5-pro-latest", model.generate_content, contents)
+    return response.text.strip().lower()
+
+
+def gemini_schema(schema):
+    """BATCH_SCHEMA without the keys Gemini's response_schema does not accept"""
+    if isinstance(schema, dict):
+        return {key: gemini_schema(value) for key, value in schema.items() if key!="additionalProperties"}
+    return schema
+
+
+def gemini_classify_text_batch(stories: dict) -> dict:
+    """Classify several stories ({story ID: text}) with one Gemini request answered as JSON"""
+    model = genai.GenerativeModel(model_name="gemini-1.5-pro-latest", system_instruction=BATCH_PROMPT)
+    response = call_api("gemini", "gemini-1.5-pro-latest", model.generate_content, batch_message(stories),
+        generation_config={"response_mime_type": "application/json", "response_schema": gemini_schema(BATCH_SCHEMA)},
+    )
+    return parse_batch(response.text, stories)
+
+
+_uploads=None
+_uploads_lock=threading.Lock()
+
+
+def default_uploads() -> UploadManager:
+    """Upload manager shared by the Gemini file classifiers when none is passed in"""
+    global _uploads
+    with _uploads_lock:
+        if _uploads is None:
+            _uploads=UploadManager()
+        return _uploads
+
+
+def close_default_uploads() -> UploadManager:
+    """Cancel the queued uploads of the shared upload manager and return it (None if there was none);
+    the next default_uploads() starts a new one"""
+    global _uploads
+    with _uploads_lock:
+        uploads, _uploads = _uploads, None
+    if uploads is not None:
+        uploads.close()
+    return uploads
+
+
+def gemini_classify_image(image_path: str, uploads: UploadManager = None, constrained: bool = False) -> str:
+    # Reuses an earlier upload of the same image while its handle is valid
+    sample_file = (uploads or default_uploads()).get(image_path)
+    if constrained:
+        return gemini_constrained("gemini-1.5-pro-latest", [sample_file, PROMPTS["image"]])
+    model = genai.GenerativeModel(model_name="gemini-1.5-pro-latest")
+    response = call_api("gemini", "gemini-1.5-pro-latest", model.generate_content, [
+        sample_file, PROMPTS["image"]
+    ])
+    return response.text.strip().lower()
+
+
+def gemini_classify_video(video_path: str, uploads: UploadManager = None, constrained: bool = False) -> str:
+    """Classify the problem size based on the video using Gemini API."""
+    # Upload the video file (or reuse an earlier upload) and wait until it has been processed
+    myfile = (uploads or default_uploads()).get(video_path)
+    if constrained:
+        return gemini_constrained("gemini-2.0-flash", [myfile, PROMPTS["video"]])
+
+    # Use the file for classification
+    model = genai.GenerativeModel(model_name="gemini-2.0-flash")
+    response = call_api("gemini", "gemini-2.0-flash", model.generate_content, [
+        myfile, PROMPTS["video"]
+    ])
+    return response.text.strip().lower()
+
+
+def gemini_classify_video_keyframes(video_path: str, constrained: bool = False) -> str:
+    """Classify a video from its de-duplicated frames and soundtrack sent inline, without uploading the MP4"""
+    contents=video_parts(video_path)+[PROMPTS["video"]+KEYFRAME_NOTE]
+    if constrained:
+        return gemini_constrained("gemini-2.0-flash", contents)
+    model = genai.GenerativeModel(model_name="gemini-2.0-flash")
+    response = call_api("gemini", "gemini-2.0-flash", model.generate_content, contents)
+    return response.text.strip().lower()
+
+
+@dataclass
+class Backend:
+    """One (provider, modality) classifier: classify() takes a script text or a file path and returns a label;
+    prefetch(), if set, is handed the items about to be classified so it can start preparing them.
+    A backend with classify_batch ({ID: item} -> {ID: label}) sends batch_size items per request instead.
+    variant names other ways of asking ("batch", "constrained"); their predictions are cached apart."""
+    provider: str
+    modality: str
+    model: str
+    classify: Callable[[str], str]
+    prefetch: Callable[[list], None] = None
+    classify_batch: Callable[[dict], dict] = None
+    batch_size: int = 1
+    prompt: str = None
+    variant: str = ""
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.modality}"
+
+    @property
+    def mode(self) -> str:
+        """Cache scope of the predictions"""
+        return f"{self.modality}/{self.variant}" if self.variant else self.modality
+
+    @property
+    def prompt_hash(self) -> str:
+        prompt=self.prompt or PROMPTS[self.modality]
+        #a variant asks the same prompt differently, so its answers must not be served to the plain backend or vice versa
+        return text_hash(f"{self.variant}\0{prompt}" if self.variant else prompt)
+
+    def content_hash(self, item: str) -> str:
+        #scripts are keyed by their text, images and videos by their bytes, so moved or renamed files still hit
+        return text_hash(item) if self.modality=="text" else file_hash(item)
+
+
+def make_backends(providers: list, modalities: list, batch_size: int = 1, constrained: bool = False, video_mode: str = "upload", image: ImageSettings = None) -> list:
+    """Backends of the requested providers and modalities; batch_size>1 packs that many stories into each text request,
+    constrained limits the answers to one of LABELS and records their log-probabilities,
+    video_mode="keyframes" sends each video's distinct frames and soundtrack instead of uploading the MP4,
+    image sends resized and re-encoded copies of the images (shared by both providers) instead of the PNGs"""
+    if batch_size>1 and constrained:
+        raise ValueError("constrained mode classifies one story per request; use batch_size=1")
+    variant="constrained" if constrained else ""
+    #the model sees other pixels, so preprocessed images are cached apart from the full-size ones
+    image_variant="+".join(([image.name] if image else [])+([variant] if variant else []))
+    backends=[]
+    if "cgpt" in providers:
+        # Initialize OpenAI client; retries are handled by call_api
+        client = OpenAI(max_retries=0)
+        if "text" in modalities:
+            if batch_size>1:
+                backends.append(Backend("cgpt", "text", "gpt-4o", lambda story: cgpt_classify_text(client, story),
+                                        classify_batch=lambda stories: cgpt_classify_text_batch(client, stories), batch_size=batch_size, prompt=BATCH_PROMPT, variant="batch"))
+            else:
+                backends.append(Backend("cgpt", "text", "gpt-4o", lambda story: cgpt_classify_text(client, story, constrained), variant=variant))
+        if "image" in modalities:
+            backends.append(Backend("cgpt", "image", "gpt-4o", lambda path: cgpt_classify_image(client, preprocess(path, image), constrained), variant=image_variant))
+        if "video" in modalities:
+            print("Video classification is only available with gemini; skipping cgpt/video")
+    if "gemini" in providers:
+        # Load API key
+        genai.configure()
+        uploads=default_uploads()
+        if "text" in modalities:
+            if batch_size>1:
+                backends.append(Backend("gemini", "text", "gemini-1.5-pro-latest", gemini_classify_text,
+                                        classify_batch=gemini_classify_text_batch, batch_size=batch_size, prompt=BATCH_PROMPT, variant="batch"))
+            else:
+                backends.append(Backend("gemini", "text", "gemini-1.5-pro-latest", lambda story: gemini_classify_text(story, constrained), variant=variant))
+        if "image" in modalities:
+            backends.append(Backend("gemini", "image", "gemini-1.5-pro-latest", lambda path: gemini_classify_image(preprocess(path, image), uploads, constrained),
+                                    lambda paths: uploads.prefetch(paths, lambda path: preprocess(path, image)), variant=image_variant))
+        if "video" in modalities and video_mode=="keyframes":
+            backends.append(Backend("gemini", "video", "gemini-2.0-flash", lambda path: gemini_classify_video_keyframes(path, constrained),
+                                    prompt=PROMPTS["video"]+KEYFRAME_NOTE, variant="+".join(["keyframes"]+([variant] if variant else []))))
+        elif "video" in modalities:
+            backends.append(Backend("gemini", "video", "gemini-2.0-flash", lambda path: gemini_classify_video(path, uploads, constrained), uploads.prefetch, variant=variant))
+    if "local" in providers:
+        from local_classifier import BATCH_SIZE, MODEL_NAME, LocalClassifier
+        if "text" in modalities:
+            local=LocalClassifier()
+            #the model fingerprint plays the part of the prompt: retraining invalidates the cached predictions
+            backends.append(Backend("local", "text", MODEL_NAME, local.classify, classify_batch=local.classify_batch, batch_size=BATCH_SIZE, prompt=local.fingerprint))
+        if "image" in modalities or "video" in modalities:
+            print("The local classifier only reads script text; skipping local/image and local/video")
+    return backends
+
+
+def scenario_dir(problem: str) -> str:
+    return os.path.join(os.getcwd(), f"{problem.capitalize()}Folder")
+
+
+def load_scenarios(problem: str) -> pd.DataFrame:
+    # Load the CSV file containing stories
+    df = pd.read_csv(os.path.join(scenario_dir(problem), f"Stats_summary_{problem}_combined.csv"))
+    # Clean column names
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def read_scenarios(problem: str, chunk_size: int = CHUNK_SIZE):
+    """The scenario table in chunks of chunk_size rows (rounded up to even), each keeping its row numbers as index.
+    Cells are read as text so every chunk comes out the same whatever its rows hold (some tables repeat the header)."""
+    path=os.path.join(scenario_dir(problem), f"Stats_summary_{problem}_combined.csv")
+    for chunk in pd.read_csv(path, chunksize=chunk_size+chunk_size%2, dtype=str):
+        chunk.columns = chunk.columns.str.strip()
+        yield chunk
+
+
+def script_groups(df: pd.DataFrame, seen: dict = None) -> dict:
+    """{row index of the first row with a script: indices of every row with the same script}.
+    Rows are matched by a hash of the script, so any row order and missing image-tool rows work;
+    pass the same seen dict ({script hash: first row index}) for the chunks of one table."""
+    seen = {} if seen is None else seen
+    groups={}
+    for index, script_text, scenario in zip(df.index, df["Script"], df["scenario"]):
+        # Skip empty scripts and header lines repeated inside the table
+        if pd.isna(script_text) or scenario=="scenario":
+            continue
+        first=seen.setdefault(text_hash(script_text), index)
+        groups.setdefault(first, []).append(index)
+    return groups
+
+
+def text_rows(df: pd.DataFrame, groups: dict, scenarios: set = None) -> dict:
+    """{row index: row index its script was classified on} with one row per scenario, taken from any row with the scenario's script;
+    pass the same scenarios set for the chunks of one table so a scenario split across chunks is written once"""
+    scenarios = set() if scenarios is None else scenarios
+    first_of={index: first for first, indices in groups.items() for index in indices}
+    rows={}
+    for index in df.index:
+        if index in first_of and df.at[index, "scenario"] not in scenarios:
+            scenarios.add(df.at[index, "scenario"])
+            rows[index]=first_of[index]
+    return rows
+
+
+def build_items(df: pd.DataFrame, problem: str, modality: str, verbose: bool = True, seen: dict = None) -> dict:
+    """{row index: script text or file path} of the rows a modality classifies; seen is passed on to script_groups"""
+    items={}
+    if modality=="text":
+        # Classify each distinct script once: the DallE3 and GPTimage rows of a scenario share the same script
+        groups=script_groups(df, seen)
+        for index in df.index:
+            if index in groups:
+                items[index]=df.at[index, "Script"]
+            elif verbose and pd.isna(df.at[index, "Script"]):
+                print(f"[Scenario {df.at[index, 'scenario']}] Script is empty or invalid.")
+        return items
+    for index, row in df.iterrows():
+        tool = row["Image_Tool"]
+        scenario = row["scenario"]
+        if modality=="image":
+            if tool not in IMAGE_TOOLS:
+                continue
+            path = os.path.join(scenario_dir(problem), f"scenario_{problem}_{scenario}_{tool}.png")
+        else:
+            path = os.path.join(scenario_dir(problem), f"video_{problem}_{scenario}_{tool}.mp4")
+        if os.path.exists(path):
+            items[index]=path
+        elif verbose:
+            print(f"[Scenario {scenario}] Tool: {tool}, {modality.capitalize()} not found: {path}")
+    return items
+
+
+def format_output(df: pd.DataFrame, modality: str, items: dict, predictions: dict, logprob_columns: bool = None, rows: list = None) -> pd.DataFrame:
+    """Lay out predictions the way the per-provider classifier scripts always wrote them;
+    logprob_columns forces the Logprob columns on or off instead of adding them when a prediction has logprobs.
+    Text keeps the rows given (one per scenario, see text_rows), or else the classified rows in items"""
+    df = df.copy()
+    if modality in ("image", "video"):
+        path_column=f"{modality.capitalize()} Path"
+        if path_column not in df.columns:
+            df[path_column] = ""
+    if "Predicted Problem Size" not in df.columns:
+        # Insert the column next to "Problem Size"
+        df.insert(df.columns.get_loc("Problem Size") + 1, "Predicted Problem Size", "")
+    if logprob_columns is None:
+        logprob_columns=any(getattr(predicted_size, "logprobs", None) for predicted_size in predictions.values())
+    if logprob_columns:
+        # Constrained mode: log-probability of every label next to the prediction
+        for offset, column in enumerate(LOGPROB_COLUMNS):
+            if column not in df.columns:
+                df.insert(df.columns.get_loc("Predicted Problem Size") + 1 + offset, column, float("nan"))
+    for index, predicted_size in predictions.items():
+        df.at[index, "Predicted Problem Size"] = str(predicted_size)
+        for label, logprob in getattr(predicted_size, "logprobs", {}).items():
+            df.at[index, f"Logprob {label}"] = round(logprob, 4)
+        if modality in ("image", "video"):
+            df.at[index, path_column] = items[index]
+    if modality=="text":
+        # Keep one row per scenario, without the "Image_Tool" column
+        df = df.loc[sorted(items if rows is None else rows)].reset_index(drop=True)
+        if "Image_Tool" in df.columns:
+            df.drop(columns=["Image_Tool"], inplace=True)
+    return df
+
+
+def output_path(problem: str, backend: Backend) -> str:
+    return f"Stats_summary_{problem}_combined_{backend.provider}_classify_{backend.modality}.csv"
+
+
+def open_journal(problem: str, backend: Backend) -> ResultJournal:
+    journal=ResultJournal(f"{output_path(problem, backend)}.part", f"{backend.mode} {backend.model} {backend.prompt_hash}", LABELS)
+    if journal.done:
+        log(f"[{backend.name}] Resuming {problem}: {len(journal.done)} rows already classified")
+    return journal
+
+
+def write_output(problem: str, backend: Backend, journal: ResultJournal, chunk_size: int = CHUNK_SIZE) -> str:
+    """Assemble the final CSV in row order from the journal, one chunk of the scenario table at a time"""
+    output_file=output_path(problem, backend)
+    tmp_path=f"{output_file}.tmp"
+    logprob_columns=journal.has_logprobs
+    seen={}
+    scenarios=set()
+    for number, chunk in enumerate(read_scenarios(problem, chunk_size)):
+        items=build_items(chunk, problem, backend.modality, verbose=False, seen=seen)
+        #a script's prediction goes to every scenario that has the script, including rows after the chunk it was classified in
+        rows=text_rows(chunk, script_groups(chunk, seen), scenarios) if backend.modality=="text" else {index: index for index in items}
+        predictions={index: Label(*journal.entries[first]) for index, first in rows.items() if first in journal.entries}
+        format_output(chunk, backend.modality, items, predictions, logprob_columns, list(rows)).to_csv(tmp_path, mode="w" if number==0 else "a", header=number==0, index=False)
+    os.replace(tmp_path, output_file)
+    journal.remove()
+    return output_file
+
+
+_print_lock=threading.Lock()
+
+
+def log(message: str) -> None:
+    """print() from worker threads without interleaving lines"""
+    with _print_lock:
+        sys.stdout.write(message+"\n")
+        sys.stdout.flush()
+
+
+class Progress:
+    """Counts finished items per backend and logs done/total and throughput at most every `interval` seconds"""
+
+    def __init__(self, interval: float = 2.0):
+        self.interval=interval
+        self.total={}
+        self.done={}
+        self.start=time.monotonic()
+        self.last=0.0
+        self._lock=threading.Lock()
+
+    def add(self, name: str, count: int) -> None:
+        with self._lock:
+            self.total[name]=self.total.get(name, 0)+count
+            self.done.setdefault(name, 0)
+
+    def update(self, name: str, final: bool = False) -> None:
+        with self._lock:
+            if not final:
+                self.done[name]+=1
+            now=time.monotonic()
+            if not final and now-self.last<self.interval:
+                return
+            self.last=now
+            done, total=sum(self.done.values()), sum(self.total.values())
+            per_backend=", ".join(f"{name} {self.done[name]}/{self.total[name]}" for name in self.total)
+        log(f"Progress: {done}/{total} items, {done/max(now-self.start, 1e-9):.2f} items/s ({per_backend})")
+
+
+def describe(backend: Backend, df: pd.DataFrame, index: int) -> str:
+    tool = f" Tool: {df.at[index, 'Image_Tool']}," if backend.modality!="text" else ""
+    return f"[{backend.name}] [Scenario {df.at[index, 'scenario']}]{tool}"
+
+
+def classify_split(backend: Backend, stories: dict) -> dict:
+    """{ID: label} of a batch; a batch that fails or does not validate is split in half and each half retried"""
+    try:
+        return backend.classify_batch(stories)
+    except Exception as e:
+        if len(stories)==1:
+            raise
+        log(f"[{backend.name}] Batch of {len(stories)} failed ({e}); splitting it")
+    ids=list(stories)
+    labels={}
+    for half in (ids[:len(ids)//2], ids[len(ids)//2:]):
+        try:
+            labels.update(classify_split(backend, {story_id: stories[story_id] for story_id in half}))
+        except Exception as e:
+            log(f"[{backend.name}] Story {half[0]} failed: {e}")
+            labels[half[0]]="Error"
+    return labels
+
+
+def classify_items(backend: Backend, df: pd.DataFrame, items: dict, progress: Progress, cache: PredictionCache = None) -> dict:
+    """{row index: label} of some items of one backend: one request per item, or one per batch"""
+    predictions={}
+    pending={}
+    for index, item in items.items():
+        content_hash=backend.content_hash(item) if cache is not None else None
+        cached=cache.get(backend.provider, backend.model, backend.prompt_hash, content_hash) if cache is not None else None
+        if cached is not None:
+            predicted_size=Label(*cached)
+            log(f"{describe(backend, df, index)} Prediction: {predicted_size} (cached)")
+            predictions[index]=predicted_size
+            progress.update(backend.name)
+        else:
+            pending[index]=(item, content_hash)
+    if backend.classify_batch is not None and pending:
+        try:
+            labels=classify_split(backend, {str(index): item for index, (item, _) in pending.items()})
+        except Exception as e:
+            log(f"[{backend.name}] Story {next(iter(pending))} failed: {e}")
+            labels={str(index): "Error" for index in pending}
+    for index, (item, content_hash) in pending.items():
+        if backend.classify_batch is not None:
+            predicted_size=labels[str(index)]
+        else:
+            try:
+                predicted_size = backend.classify(item)
+            except Exception as e:
+                log(f"{describe(backend, df, index)} Failed: {e}")
+                predicted_size = "Error"
+        if predicted_size!="Error":
+            log(f"{describe(backend, df, index)} Prediction: {predicted_size}")
+            if cache is not None:
+                cache.put(backend.provider, backend.model, backend.mode, backend.prompt_hash, content_hash, str(predicted_size), getattr(predicted_size, "logprobs", None))
+        predictions[index]=predicted_size
+        progress.update(backend.name)
+    return predictions
+
+
+def run_classification(problems: list, providers: list, modalities: list, workers: dict = None, cache: PredictionCache = None, batch_size: int = 1, constrained: bool = False, chunk_size: int = CHUNK_SIZE, video_mode: str = "upload", image: ImageSettings = None) -> None:
+    """Classify every requested (problem, provider, modality), reading each scenario table in chunks of chunk_size rows.
+    Each provider has its own pool of `workers[provider]` threads and all of them run at once. Every prediction
+    is appended to a journal next to its CSV as it arrives; a rerun after a crash skips the rows with a valid
+    prediction, and the final CSV is written in row order once a problem size is done.
+    With a cache, inputs already classified by the same model and prompt are answered without an API call;
+    batch_size>1 sends that many stories per text request; constrained adds per-label log-probabilities to the CSVs;
+    image classifies resized and re-encoded copies of the images."""
+    workers={**PROVIDER_WORKERS, **(workers or {})}
+    backends=make_backends(providers, modalities, batch_size, constrained, video_mode, image)
+    if cache is not None:
+        for backend in backends:
+            #predictions made with an older version of the prompt can never be hit again
+            removed=cache.invalidate_prompt(backend.provider, backend.model, backend.mode, backend.prompt_hash)
+            if removed:
+                log(f"[{backend.name}] Prompt changed; dropped {removed} cached predictions")
+    pools={provider: ThreadPoolExecutor(max_workers=workers[provider], thread_name_prefix=provider) for provider in {backend.provider for backend in backends}}
+    progress=Progress()
+    journals={}
+    try:
+        for problem in problems:
+            journals={backend.name: open_journal(problem, backend) for backend in backends}
+            #scripts already met in earlier chunks of this table
+            seen={}
+            #one chunk of the table at a time keeps memory bounded; within a chunk all pools work at once
+            for chunk in read_scenarios(problem, chunk_size):
+                items={modality: build_items(chunk, problem, modality, seen=seen) for modality in {backend.modality for backend in backends}}
+                futures={}
+                for backend in backends:
+                    done=journals[backend.name].done
+                    pending={index: item for index, item in items[backend.modality].items() if index not in done}
+                    progress.add(backend.name, len(pending))
+                    if backend.prefetch is not None:
+                        #e.g. upload the files the cache cannot answer while the workers classify the first ones
+                        backend.prefetch([item for item in pending.values()
+                                          if cache is None or not cache.contains(backend.provider, backend.model, backend.prompt_hash, backend.content_hash(item))])
+                    indices=list(pending)
+                    for start in range(0, len(indices), backend.batch_size):
+                        batch={index: pending[index] for index in indices[start:start+backend.batch_size]}
+                        futures[pools[backend.provider].submit(classify_items, backend, chunk, batch, progress, cache)]=backend
+                for future in as_completed(futures):
+                    # Append each answer to the journal as soon as it arrives
+                    journals[futures[future].name].add(future.result())
+            for backend in backends:
+                log(f"Predictions saved to: {write_output(problem, backend, journals.pop(backend.name), chunk_size)}")
+    finally:
+        for pool in pools.values():
+            pool.shutdown(cancel_futures=True)
+        for journal in journals.values():
+            journal.close()
+        #queued prefetch uploads would otherwise keep the process alive after an error
+        uploads=close_default_uploads()
+    progress.update("", final=True)
+    if cache is not None:
+        log(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
+    if uploads is not None:
+        log(f"Gemini files: {uploads.uploads} uploaded, {uploads.reused} reused from earlier runs")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify generated scenarios by problem size with several providers and modalities at once")
+    parser.add_argument("--problems", nargs="+", default=["glitch", "bummer", "disaster"], choices=["glitch", "bummer", "disaster"])
+    parser.add_argument("--providers", nargs="+", default=DEFAULT_PROVIDERS, choices=PROVIDERS,
+                        help="local is the offline text model of local_classifier.py (train it first with --train)")
+    parser.add_argument("--modalities", nargs="+", default=MODALITIES, choices=MODALITIES)
+    parser.add_argument("--workers", nargs="+", default=[], metavar="PROVIDER=N",
+                        help=f"calls in flight per provider, e.g. cgpt=16 gemini=4 (default {' '.join(f'{p}={n}' for p, n in PROVIDER_WORKERS.items())})")
+    parser.add_argument("--batch-size", type=int, default=1, help="stories per text classification request; answers come back as JSON, one label per story")
+    parser.add_argument("--constrained", action="store_true", help="one-token / enum answers restricted to glitch, bummer, disaster, with per-label log-probabilities")
+    parser.add_argument("--video-mode", default="upload", choices=["upload", "keyframes"],
+                        help="upload the MP4 to Gemini, or send its distinct frames and soundtrack inline")
+    parser.add_argument("--image-size", type=int, default=0, help="resize images to this longest side in pixels before sending them (0 sends the original PNGs)")
+    parser.add_argument("--image-format", default="jpeg", choices=["jpeg", "webp"], help="encoding of the resized images")
+    parser.add_argument("--image-quality", type=int, default=85, help="JPEG/WebP quality of the resized images")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="scenario table rows read and classified at a time")
+    parser.add_argument("--cache", default=CACHE_PATH, help="prediction cache keyed by provider, model, prompt and input content")
+    parser.add_argument("--no-cache", action="store_true", help="always call the APIs")
+    parser.add_argument("--cache-max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS)
+    parser.add_argument("--cache-max-entries", type=int, default=DEFAULT_MAX_ENTRIES)
+    args=parser.parse_args()
+    #the batch answer is free JSON with no per-label log-probabilities, so the two modes cannot be combined
+    if args.batch_size>1 and args.constrained:
+        parser.error("--constrained classifies one story per request; it cannot be combined with --batch-size")
+    return args
+
+
+def parse_workers(values: list) -> dict:
+    workers={}
+    for value in values:
+        provider, _, count = value.partition("=")
+        if provider not in PROVIDER_WORKERS or not count.isdigit() or int(count)<1:
+            raise SystemExit(f"--workers expects PROVIDER=N with PROVIDER in {PROVIDERS}, got {value!r}")
+        workers[provider]=int(count)
+    return workers
+
+
+def main():
+    args = parse_args()
+    cache=None if args.no_cache else PredictionCache(args.cache, args.cache_max_age_days, args.cache_max_entries)
+    image=ImageSettings(args.image_size, args.image_format, args.image_quality) if args.image_size>0 else None
+    try:
+        run_classification(args.problems, args.providers, args.modalities, parse_workers(args.workers), cache, max(1, args.batch_size), args.constrained, max(2, args.chunk_size), args.video_mode, image)
+    finally:
+        if cache is not None:
+            cache.close()
+
+if __name__ == "__main__":
+    main()
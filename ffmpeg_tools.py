@@ -0,0 +1,30 @@
+import shutil
+import subprocess
+
+from PIL import Image
+
+
+def ffmpeg_exe() -> str:
+    """ffmpeg binary bundled with moviepy (imageio-ffmpeg), or the one on PATH"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        exe=shutil.which("ffmpeg")
+        if exe is None:
+            raise FileNotFoundError("ffmpeg not found")
+        return exe
+
+
+def read_frames(video_path: str, input_params: list = (), output_params: list = ()):
+    """Decoded frames of a video as RGB images, streamed from ffmpeg one PPM at a time"""
+    command=[ffmpeg_exe(), "-loglevel", "error", *input_params, "-i", video_path, *output_params, "-f", "image2pipe", "-vcodec", "ppm", "pipe:1"]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        #ffmpeg writes each frame as "P6\n<width> <height>\n255\n" followed by the pixels
+        while process.stdout.readline():
+            width, height = map(int, process.stdout.readline().split())
+            process.stdout.readline()
+            yield Image.frombytes("RGB", (width, height), process.stdout.read(width*height*3))
+        error=process.stderr.read()
+        if process.wait()!=0:
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=error)
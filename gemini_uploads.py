@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep, time
+from typing import Callable
+
+import google.generativeai as genai
+
+from api_calls import call_api
+from cache_tools import SingleFlight
+from prediction_cache import file_hash
+
+#Gemini keeps uploaded files for 48 hours; stop reusing a handle this long before it expires
+EXPIRY_MARGIN = 15*60
+#file state polling: first check after POLL_START seconds, then back off up to POLL_MAX until POLL_TIMEOUT
+POLL_START = 0.5
+POLL_MAX = 8.0
+POLL_TIMEOUT = 600.0
+
+
+class UploadManager:
+    """Uploads each distinct file to the Gemini File API once and hands out ACTIVE handles.
+    Handles are remembered by content hash in a small JSON index, so later runs reuse them until they
+    expire; prefetch() uploads ahead on a background pool while earlier files are being classified."""
+
+    def __init__(self, index_path: str = ".gemini_uploads.json", upload_workers: int = 4):
+        self.index_path=index_path
+        self.uploads=0
+        self.reused=0
+        self._index=self._load()
+        self._handles=SingleFlight()
+        self._lock=threading.Lock()
+        self._pool=ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="upload")
+
+    def _load(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                index=json.load(f)
+        except (OSError, ValueError):
+            return {}
+        #content hash -> {"name", "uri", "expires"}; drop handles that are about to expire
+        return {key: entry for key, entry in index.items() if entry["expires"]-EXPIRY_MARGIN>time()}
+
+    def _save(self) -> None:
+        #called with self._lock held
+        tmp_path=f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def prefetch(self, paths, prepare: Callable[[str], str] = None) -> None:
+        """Start uploading paths in the background; get() then waits for the upload already in flight.
+        prepare, if set, maps each path to the file actually uploaded (e.g. a resized copy) on the upload pool."""
+        for path in paths:
+            if prepare is None:
+                self._handles.submit(path, lambda path=path: self._handle(path), self._pool)
+            else:
+                self._pool.submit(lambda path=path: self.get(prepare(path)))
+
+    def get(self, path: str):
+        """ACTIVE Gemini file for the content of path, uploading it only if no valid handle exists"""
+        return self._handles.do(path, lambda: self._handle(path))
+
+    def _handle(self, path: str):
+        key=file_hash(path)
+        with self._lock:
+            entry=self._index.get(key)
+        if entry is not None and entry["expires"]-EXPIRY_MARGIN>time():
+            try:
+                myfile=call_api("gemini", "files", genai.get_file, entry["name"])
+                with self._lock:
+                    self.reused+=1
+                return self.wait_active(myfile)
+            except Exception as e:
+                print(f"Stored upload of {os.path.basename(path)} is no longer usable ({type(e).__name__}); uploading again")
+        myfile = call_api("gemini", "upload", genai.upload_file,
+            path=path,
+            display_name=os.path.basename(path)
+        )
+        print(f"Uploaded file '{os.path.basename(path)}' as: {myfile.uri}")
+        with self._lock:
+            self.uploads+=1
+            self._index[key]={"name": myfile.name, "uri": myfile.uri, "expires": myfile.expiration_time.timestamp()}
+            self._save()
+        return self.wait_active(myfile)
+
+    def wait_active(self, myfile):
+        """Poll the file state with backoff until the service has finished processing it"""
+        delay=POLL_START
+        deadline=monotonic()+POLL_TIMEOUT
+        while myfile.state.name=="PROCESSING":
+            if monotonic()>deadline:
+                raise TimeoutError(f"{myfile.name} still processing after {POLL_TIMEOUT:.0f}s")
+            sleep(delay)
+            delay=min(delay*2, POLL_MAX)
+            myfile=call_api("gemini", "files", genai.get_file, myfile.name)
+        if myfile.state.name!="ACTIVE":
+            raise RuntimeError(f"{myfile.name} is {myfile.state.name}: {myfile.error.message}")
+        return myfile
+
+    def close(self) -> None:
+        self._pool.shutdown(cancel_futures=True)
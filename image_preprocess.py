@@ -0,0 +1,86 @@
+import io
+import os
+import threading
+from dataclasses import dataclass
+
+from PIL import Image
+
+from cache_tools import DiskLRU, SingleFlight
+from prediction_cache import file_hash, text_hash
+
+FORMATS = {"jpeg": ("JPEG", "jpg", "image/jpeg"), "webp": ("WEBP", "webp", "image/webp"), "png": ("PNG", "png", "image/png")}
+CACHE_DIR = ".image_cache"
+#resized copies are small; least recently used ones go above this size
+CACHE_MAX_BYTES = 512*1024*1024
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    """Target of the preprocessing: longest side in pixels (0 keeps the size), format and quality"""
+    max_side: int = 0
+    fmt: str = "jpeg"
+    quality: int = 85
+
+    @property
+    def name(self) -> str:
+        return f"{self.fmt}{self.max_side or 'full'}q{self.quality}"
+
+
+def image_mime(path: str) -> str:
+    extension=os.path.splitext(path)[1].lower().lstrip(".")
+    for _, ext, mime in FORMATS.values():
+        if extension==ext or (ext=="jpg" and extension=="jpeg"):
+            return mime
+    return "image/png"
+
+
+class ImageCache:
+    """Resized and re-encoded copies of images, stored under the hash of the source content and the settings,
+    so every provider and every run reuses the same file"""
+
+    def __init__(self, folder: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.folder=folder
+        self.hits=0
+        self.misses=0
+        self._lock=threading.Lock()
+        self._files=DiskLRU(folder, max_bytes)
+        #two workers asking for the same copy wait for one encode
+        self._encoding=SingleFlight(remember=False)
+
+    def prepare(self, path: str, settings: ImageSettings) -> str:
+        """Path of the preprocessed copy of an image, encoding it on first use"""
+        _, extension, _ = FORMATS[settings.fmt]
+        key=text_hash(f"{file_hash(path)}\0{settings.name}")
+        output=self._files.path(f"{key}.{extension}")
+        return self._encoding.do(output, lambda: self._prepare(path, settings, output))
+
+    def _prepare(self, path: str, settings: ImageSettings, output: str) -> str:
+        if self._files.get(output):
+            with self._lock:
+                self.hits+=1
+            return output
+        with Image.open(path) as image:
+            image=image.convert("RGB")
+            if settings.max_side and max(image.size)>settings.max_side:
+                image.thumbnail((settings.max_side, settings.max_side), Image.Resampling.LANCZOS)
+            buffer=io.BytesIO()
+            image.save(buffer, FORMATS[settings.fmt][0], quality=settings.quality, optimize=True)
+        self._files.put(output, buffer.getvalue())
+        with self._lock:
+            self.misses+=1
+        return output
+
+
+_cache=None
+_cache_lock=threading.Lock()
+
+
+def preprocess(path: str, settings: ImageSettings = None) -> str:
+    """Image to send for path: the original when settings is None, else its cached preprocessed copy"""
+    global _cache
+    if settings is None:
+        return path
+    with _cache_lock:
+        if _cache is None:
+            _cache=ImageCache()
+    return _cache.prepare(path, settings)
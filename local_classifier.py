@@ -0,0 +1,148 @@
+import argparse
+import math
+import os
+from time import perf_counter
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import classification_report, confusion_matrix
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import make_pipeline, make_union
+
+from classify_all import LABELS, Label, load_scenarios, script_groups
+from prediction_cache import text_hash
+
+MODEL_PATH = "local_classifier.joblib"
+MODEL_NAME = "hashing-logreg"
+#2^18 hashed features per vectorizer; collisions are rare at this vocabulary size and the model stays under a few MB
+N_FEATURES = 2**18
+FOLDS = 5
+#stories per vectorized predict call when running as a classify_all backend
+BATCH_SIZE = 512
+
+
+def make_model():
+    """Word 1-2-grams and character 3-5-grams, hashed so there is no vocabulary to fit or store, then tf-idf and a logistic regression"""
+    features=make_union(HashingVectorizer(ngram_range=(1, 2), n_features=N_FEATURES, alternate_sign=False, norm=None),
+                        HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=N_FEATURES, alternate_sign=False, norm=None))
+    return make_pipeline(features, TfidfTransformer(sublinear_tf=True), LogisticRegression(C=10.0, max_iter=2000))
+
+
+def training_data(problems: list = LABELS) -> tuple:
+    """(scripts, labels) of every distinct labeled script in the generation summaries"""
+    scripts, labels = [], []
+    seen={}
+    for problem in problems:
+        df=load_scenarios(problem)
+        for index in script_groups(df, seen):
+            label=str(df.at[index, "Problem Size"]).lower()
+            if label in LABELS:
+                scripts.append(df.at[index, "Script"])
+                labels.append(label)
+    return scripts, labels
+
+
+def fold_predictions(scripts: list, labels: list, folds: int = FOLDS) -> np.ndarray:
+    """Out-of-fold label probabilities (columns in LABELS order): each script is predicted by a model that never saw it"""
+    splits=StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+    probs=cross_val_predict(make_model(), scripts, labels, cv=splits, method="predict_proba")
+    #cross_val_predict orders the columns by sorted class name
+    order=[sorted(LABELS).index(label) for label in LABELS]
+    return probs[:, order]
+
+
+def evaluate(scripts: list, labels: list, folds: int = FOLDS) -> np.ndarray:
+    probs=fold_predictions(scripts, labels, folds)
+    predicted=[LABELS[column] for column in probs.argmax(axis=1)]
+    print(f"{folds}-fold cross-validation on {len(scripts)} scripts: accuracy {np.mean(np.array(predicted)==np.array(labels)):.3f}")
+    print(classification_report(labels, predicted, labels=LABELS, digits=3, zero_division=0))
+    print("Confusion matrix (rows: true, columns: predicted", LABELS, ")")
+    print(confusion_matrix(labels, predicted, labels=LABELS))
+    return probs
+
+
+def train(problems: list = LABELS, folds: int = FOLDS, path: str = MODEL_PATH) -> dict:
+    """Fit on every labeled script and save the model with the out-of-fold predictions of its training scripts"""
+    scripts, labels = training_data(problems)
+    probs=evaluate(scripts, labels, folds)
+    before=perf_counter()
+    model=make_model().fit(scripts, labels)
+    print(f"Trained on {len(scripts)} scripts in {perf_counter()-before:.2f}s")
+    #a training script classified by the full model would score as if it were unseen; answer it from its fold instead
+    held_out={text_hash(script): dict(zip(LABELS, row.tolist())) for script, row in zip(scripts, probs)}
+    fingerprint=text_hash("\0".join(f"{label}\0{script}" for script, label in sorted(zip(scripts, labels)))+repr(model.get_params()))
+    saved={"model": model, "held_out": held_out, "fingerprint": fingerprint}
+    joblib.dump(saved, path, compress=3)
+    print(f"Model saved to: {path}")
+    return saved
+
+
+class LocalClassifier:
+    """The saved model as a classify_all text backend; labels carry their log-probabilities like the constrained mode"""
+
+    def __init__(self, path: str = MODEL_PATH):
+        if not os.path.exists(path):
+            raise SystemExit(f"{path} not found; train it first with: python local_classifier.py --train")
+        saved=joblib.load(path)
+        self.model=saved["model"]
+        self.held_out=saved["held_out"]
+        #changes whenever the model is retrained, so cached and journaled predictions of an older model are dropped
+        self.fingerprint=saved["fingerprint"]
+        self._columns=[list(self.model.classes_).index(label) for label in LABELS]
+
+    def classify_batch(self, stories: dict) -> dict:
+        """{ID: Label} for {ID: story} in one vectorized predict call"""
+        ids=list(stories)
+        probs={story_id: self.held_out.get(text_hash(stories[story_id])) for story_id in ids}
+        unseen=[story_id for story_id in ids if probs[story_id] is None]
+        if unseen:
+            rows=self.model.predict_proba([stories[story_id] for story_id in unseen])[:, self._columns]
+            probs.update({story_id: dict(zip(LABELS, row.tolist())) for story_id, row in zip(unseen, rows)})
+        labels={}
+        for story_id in ids:
+            logprobs={label: math.log(max(prob, 1e-12)) for label, prob in probs[story_id].items()}
+            labels[story_id]=Label(max(logprobs, key=logprobs.get), logprobs)
+        return labels
+
+    def classify(self, story: str) -> Label:
+        return self.classify_batch({"0": story})["0"]
+
+
+def benchmark(path: str = MODEL_PATH, copies: int = 20) -> None:
+    """Stories per second of the saved model on the training scripts, repeated and perturbed so none is answered from held_out"""
+    classifier=LocalClassifier(path)
+    scripts, _ = training_data()
+    stories={str(number): f"{script} ({number})" for number, script in enumerate(scripts*copies)}
+    before=perf_counter()
+    for start in range(0, len(stories), BATCH_SIZE):
+        ids=list(stories)[start:start+BATCH_SIZE]
+        classifier.classify_batch({story_id: stories[story_id] for story_id in ids})
+    seconds=perf_counter()-before
+    print(f"Classified {len(stories)} stories in {seconds:.2f}s ({len(stories)/seconds:.0f} stories/s)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local hashed n-gram + logistic regression problem size classifier trained on the generated scripts")
+    parser.add_argument("--train", action="store_true", help="cross-validate, fit on every labeled script and save the model")
+    parser.add_argument("--evaluate", action="store_true", help="only report the cross-validated accuracy")
+    parser.add_argument("--benchmark", action="store_true", help="measure the classification speed of the saved model")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--model", default=MODEL_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.evaluate:
+        evaluate(*training_data(), args.folds)
+    if args.train:
+        train(folds=args.folds, path=args.model)
+    if args.benchmark:
+        benchmark(args.model)
+    if not (args.evaluate or args.train or args.benchmark):
+        print("Nothing to do: pass --train, --evaluate and/or --benchmark")
+
+if __name__ == "__main__":
+    main()
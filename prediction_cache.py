@@ -0,0 +1,134 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    modality TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    prediction TEXT NOT NULL,
+    logprobs TEXT,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (provider, model, prompt_hash, content_hash)
+)
+"""
+
+#entries unused for longer than this are dropped when the cache is opened
+DEFAULT_MAX_AGE_DAYS = 180
+#least recently used entries above this count are dropped when the cache is opened
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    #the same file is hashed by the cache and by the upload manager; only read it again once it changed
+    stat=os.stat(path)
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    digest=hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """SQLite store of classifier predictions keyed by (provider, model, prompt hash, input content hash),
+    so re-runs only pay for inputs, prompts or models they have not seen before"""
+
+    def __init__(self, path: str, max_age_days: float = DEFAULT_MAX_AGE_DAYS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path=path
+        self.hits=0
+        self.misses=0
+        self._lock=threading.Lock()
+        self._conn=sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=60000")
+        self._conn.execute(SCHEMA)
+        #caches created before per-label log-probabilities were stored
+        if "logprobs" not in [row[1] for row in self._conn.execute("PRAGMA table_info(predictions)")]:
+            self._conn.execute("ALTER TABLE predictions ADD COLUMN logprobs TEXT")
+        self.evict(max_age_days, max_entries)
+
+    def get(self, provider: str, model: str, prompt_hash: str, content_hash: str):
+        """(prediction, {label: logprob} or None), or None if the input was never classified with this model and prompt"""
+        with self._lock:
+            row=self._conn.execute("SELECT prediction, logprobs FROM predictions WHERE provider = ? AND model = ? AND prompt_hash = ? AND content_hash = ?",
+                                   (provider, model, prompt_hash, content_hash)).fetchone()
+            if row is None:
+                self.misses+=1
+                return None
+            self.hits+=1
+            self._conn.execute("UPDATE predictions SET used_at = ? WHERE provider = ? AND model = ? AND prompt_hash = ? AND content_hash = ?",
+                               (time(), provider, model, prompt_hash, content_hash))
+            return row[0], json.loads(row[1]) if row[1] else None
+
+    def contains(self, provider: str, model: str, prompt_hash: str, content_hash: str) -> bool:
+        """Like get() but without counting a hit or miss"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM predictions WHERE provider = ? AND model = ? AND prompt_hash = ? AND content_hash = ?",
+                                      (provider, model, prompt_hash, content_hash)).fetchone() is not None
+
+    def put(self, provider: str, model: str, modality: str, prompt_hash: str, content_hash: str, prediction: str, logprobs: dict = None) -> None:
+        now=time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO predictions (provider, model, modality, prompt_hash, content_hash, prediction, logprobs, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (provider, model, modality, prompt_hash, content_hash, prediction, json.dumps(logprobs) if logprobs else None, now, now))
+
+    def invalidate_prompt(self, provider: str, model: str, modality: str, prompt_hash: str) -> int:
+        """Drop the (provider, model, modality) predictions made with any other prompt; returns the number removed"""
+        with self._lock:
+            return self._conn.execute("DELETE FROM predictions WHERE provider = ? AND model = ? AND modality = ? AND prompt_hash != ?",
+                                      (provider, model, modality, prompt_hash)).rowcount
+
+    def evict(self, max_age_days: float, max_entries: int) -> int:
+        """Drop entries unused for max_age_days, then the least recently used ones above max_entries"""
+        with self._lock:
+            removed=self._conn.execute("DELETE FROM predictions WHERE used_at < ?", (time()-max_age_days*86400,)).rowcount
+            removed+=self._conn.execute("DELETE FROM predictions WHERE rowid IN (SELECT rowid FROM predictions ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                                        (max_entries,)).rowcount
+            return removed
+
+    def clear(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM predictions").rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the classifier prediction cache")
+    parser.add_argument("cache", nargs="?", default="prediction_cache.sqlite")
+    parser.add_argument("--clear", action="store_true", help="remove every cached prediction")
+    args = parser.parse_args()
+    cache=PredictionCache(args.cache)
+    if args.clear:
+        print(f"{cache.clear()} predictions removed from {args.cache}")
+    else:
+        print(f"{cache.count()} predictions cached in {args.cache}")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
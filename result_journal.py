@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+
+
+class ResultJournal:
+    """Append-only JSONL of the predictions behind one output CSV. Every prediction is flushed to disk as it
+    arrives, so a run that crashes resumes with the rows that already have a valid prediction."""
+
+    def __init__(self, path: str, identity: str, valid: list):
+        self.path=path
+        #predictions of another model, prompt or mode must not be mixed into this output
+        self.identity=identity
+        self.valid=set(valid)
+        #row index -> (prediction, {label: logprob} or None), including failed rows
+        self.entries={}
+        self._lock=threading.Lock()
+        if os.path.exists(path):
+            self._load()
+        new=not os.path.exists(path)
+        self._file=open(path, "a")
+        if new:
+            self._write({"identity": identity})
+
+    def _load(self) -> None:
+        with open(self.path) as f:
+            lines=f.read().splitlines()
+        try:
+            header=json.loads(lines[0]) if lines else {}
+        except ValueError:
+            header={}
+        if header.get("identity")!=self.identity:
+            print(f"{self.path} belongs to another classifier setup; starting over")
+            os.remove(self.path)
+            return
+        for line in lines[1:]:
+            try:
+                entry=json.loads(line)
+            except ValueError:
+                #the last line of a crashed run may be cut off
+                continue
+            self.entries[entry["index"]]=(entry["prediction"], entry.get("logprobs"))
+
+    @property
+    def done(self) -> set:
+        """Row indices that already have a valid prediction"""
+        return {index for index, (prediction, _) in self.entries.items() if prediction in self.valid}
+
+    @property
+    def has_logprobs(self) -> bool:
+        return any(logprobs for _, logprobs in self.entries.values())
+
+    def add(self, predictions: dict) -> None:
+        """Record {row index: prediction}; predictions may carry a .logprobs dict"""
+        with self._lock:
+            for index, prediction in predictions.items():
+                index=int(index)
+                logprobs=getattr(prediction, "logprobs", None) or None
+                self.entries[index]=(str(prediction), logprobs)
+                self._write({"index": index, "prediction": str(prediction), "logprobs": logprobs}, flush=False)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _write(self, entry: dict, flush: bool = True) -> None:
+        self._file.write(json.dumps(entry)+"\n")
+        if flush:
+            self._file.flush()
+
+    def remove(self) -> None:
+        """Close and delete the journal once the final CSV is written"""
+        with self._lock:
+            self._file.close()
+            os.remove(self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,162 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from time import time
+
+#column layout of Stats_summary_{problem}_combined.csv read by the classifiers and the Analysis scripts
+CSV_COLUMNS = ["scenario","Image_Tool","Total_Time","Time_Script","Time_Image","Time_Voice","Time_Video","Problem Size", "setting","Script"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats (
+    problem_size TEXT NOT NULL,
+    scenario INTEGER NOT NULL,
+    image_tool TEXT NOT NULL,
+    total_time REAL NOT NULL,
+    time_script REAL NOT NULL,
+    time_image REAL NOT NULL,
+    time_voice REAL NOT NULL,
+    time_video REAL NOT NULL,
+    setting TEXT NOT NULL,
+    script TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (problem_size, scenario, image_tool)
+)
+"""
+
+#scenario numbers handed out to runs, so parallel runs of one problem size never generate the same scenario
+CLAIMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS claims (
+    problem_size TEXT NOT NULL,
+    scenario INTEGER NOT NULL,
+    owner TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    PRIMARY KEY (problem_size, scenario)
+)
+"""
+
+FIELDS = ["problem_size", "scenario", "image_tool", "total_time", "time_script", "time_image", "time_voice", "time_video", "setting", "script"]
+
+
+class RunLedger:
+    """SQLite (WAL mode) store of generation stats rows that many threads and processes can write at once"""
+
+    def __init__(self, path: str):
+        self.path=path
+        self._lock=threading.Lock()
+        self._conn=sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        #WAL lets readers and one writer at a time proceed without blocking each other; busy writers wait instead of failing
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=60000")
+        self._conn.execute(SCHEMA)
+        self._conn.execute(CLAIMS_SCHEMA)
+
+    def add_rows(self, rows: list[dict]) -> None:
+        """Insert the rows of one scenario in a single transaction; re-adding a (problem_size, scenario, tool) replaces it"""
+        values=[tuple(row[field] for field in FIELDS)+(time(),) for row in rows]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(f"INSERT OR REPLACE INTO stats ({', '.join(FIELDS)}, recorded_at) VALUES ({', '.join('?'*(len(FIELDS)+1))})", values)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def import_csv(self, problem_size: str, path: str) -> int:
+        """Copy the rows of an existing Stats_summary csv that the ledger does not have yet (rows written before the
+        ledger existed, e.g. the committed summaries); returns the number of rows added. Ledger rows win on conflicts."""
+        if not os.path.exists(path):
+            return 0
+        values=[]
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                row={(key or "").strip(): value for key, value in row.items()}
+                try:
+                    scenario=int(row["scenario"])
+                except (TypeError, ValueError):
+                    #header lines repeated inside the data
+                    continue
+                times=[]
+                for column in ["Total_Time", "Time_Script", "Time_Image", "Time_Voice", "Time_Video"]:
+                    try:
+                        times.append(float(row[column]))
+                    except (TypeError, ValueError):
+                        print(f"{path}: scenario {scenario} has no valid {column}; keeping the row with 0")
+                        times.append(0.0)
+                values.append((problem_size, scenario, row["Image_Tool"], *times, row.get("setting") or "", row.get("Script") or "", time()))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                before=self._conn.total_changes
+                self._conn.executemany(f"INSERT OR IGNORE INTO stats ({', '.join(FIELDS)}, recorded_at) VALUES ({', '.join('?'*(len(FIELDS)+1))})", values)
+                added=self._conn.total_changes-before
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim_scenario(self, problem_size: str, owner: str) -> int:
+        """Reserve the next scenario number after every one stored or claimed, in one transaction, so runs in
+        other threads or processes never get the same number; a new run adds scenarios instead of replacing them"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                scenario=self._conn.execute("SELECT COALESCE(MAX(scenario), 0)+1 FROM (SELECT scenario FROM stats WHERE problem_size = ? "
+                                            "UNION ALL SELECT scenario FROM claims WHERE problem_size = ?)", (problem_size, problem_size)).fetchone()[0]
+                self._conn.execute("INSERT INTO claims (problem_size, scenario, owner, claimed_at) VALUES (?, ?, ?, ?)", (problem_size, scenario, owner, time()))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return scenario
+
+    def rows(self, problem_size: str) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(f"SELECT {', '.join(FIELDS)} FROM stats WHERE problem_size = ? ORDER BY scenario, image_tool", (problem_size,)).fetchall()
+
+    def export_csv(self, problem_size: str, path: str) -> int:
+        """Write the rows of one problem size in the Stats_summary_*_combined.csv layout; returns the number of rows.
+        Rows already in the csv are merged in first, so an export never drops rows the ledger does not know about."""
+        self.import_csv(problem_size, path)
+        rows=self.rows(problem_size)
+        #one temp file per process: parallel runs export the same csv when they finish
+        tmp_path=f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer_object=csv.writer(f)
+            writer_object.writerow(CSV_COLUMNS)
+            for problem, scenario, tool, total_time, time_script, time_image, time_voice, time_video, setting, script in rows:
+                writer_object.writerow([scenario, tool, format(total_time, '.2f'), format(time_script, '.2f'), format(time_image, '.2f'), format(time_voice, '.2f'), format(time_video, '.2f'), problem, setting, script])
+        os.replace(tmp_path, path)
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def stats_csv_path(problem: str, root: str = None) -> str:
+    root=root or os.getcwd()
+    return os.path.join(root, f"{problem.capitalize()}Folder", f"Stats_summary_{problem}_combined.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export generation stats from the run ledger to Stats_summary_*_combined.csv")
+    parser.add_argument("ledger", nargs="?", default="run_ledger.sqlite")
+    parser.add_argument("--problem", nargs="+", default=["glitch", "bummer", "disaster"])
+    args = parser.parse_args()
+    ledger=RunLedger(args.ledger)
+    for problem in args.problem:
+        path=stats_csv_path(problem)
+        if not ledger.rows(problem) and not os.path.exists(path):
+            print(f"No {problem} rows in {args.ledger}")
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"{ledger.export_csv(problem, path)} rows exported to {path}")
+    ledger.close()
+
+if __name__ == "__main__":
+    main()
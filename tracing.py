@@ -0,0 +1,89 @@
+import contextvars
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+#(scenario, lane) the spans of the current task or thread belong to; asyncio.to_thread carries it into worker threads
+_track=contextvars.ContextVar("track", default=(0, "main"))
+
+
+class Span:
+    def __init__(self, name: str):
+        self.name=name
+        self.start=perf_counter_ns()
+        self.end=None
+        #seconds the call spent queued in the API rate limiter or sleeping before a retry
+        self.waited=0.0
+
+    @property
+    def seconds(self) -> float:
+        """Duration without rate-limit and retry waits"""
+        end=self.end if self.end is not None else perf_counter_ns()
+        return (end-self.start)/1e9-self.waited
+
+
+class Tracer:
+    """Collects timed spans on a monotonic clock and exports them as a Chrome/Perfetto trace"""
+
+    def __init__(self):
+        self.origin=perf_counter_ns()
+        self.events=[]
+        self._lanes={}
+        self._lock=threading.Lock()
+
+    @contextmanager
+    def track(self, scenario: int, lane: str = "pipeline"):
+        """Put the spans opened inside the block on the given scenario's lane"""
+        token=_track.set((scenario, lane))
+        try:
+            yield
+        finally:
+            _track.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        span=Span(name)
+        waits=_waits.set(span)
+        try:
+            yield span
+        finally:
+            _waits.reset(waits)
+            span.end=perf_counter_ns()
+            scenario, lane=_track.get()
+            if span.waited>=0.001:
+                args["waited_s"]=round(span.waited, 3)
+            self._add(name, scenario, lane, span.start, span.end, args)
+
+    def _add(self, name, scenario, lane, start, end, args) -> None:
+        with self._lock:
+            tid=self._lanes.setdefault(lane, len(self._lanes)+1)
+            self.events.append({"name": name, "cat": lane, "ph": "X", "pid": scenario, "tid": tid,
+                                "ts": (start-self.origin)/1000, "dur": (end-start)/1000, "args": args})
+
+    def export(self, path: str) -> None:
+        """Write the spans as Chrome trace event JSON (chrome://tracing, ui.perfetto.dev); one process per scenario"""
+        with self._lock:
+            events=list(self.events)
+            lanes=dict(self._lanes)
+        metadata=[]
+        for scenario in sorted({event["pid"] for event in events}):
+            metadata.append({"name": "process_name", "ph": "M", "pid": scenario, "args": {"name": f"Scenario {scenario}" if scenario else "Run"}})
+            metadata.append({"name": "process_sort_index", "ph": "M", "pid": scenario, "args": {"sort_index": scenario}})
+            for lane, tid in lanes.items():
+                metadata.append({"name": "thread_name", "ph": "M", "pid": scenario, "tid": tid, "args": {"name": lane}})
+        tmp_path=f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": metadata+events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, path)
+
+
+#innermost open span; api_calls adds its waits to it so stage timings can leave them out
+_waits=contextvars.ContextVar("waits", default=None)
+
+
+def add_wait(seconds: float) -> None:
+    span=_waits.get()
+    if span is not None:
+        span.waited+=seconds
@@ -0,0 +1,67 @@
+import io
+import subprocess
+
+from PIL import Image
+
+from ffmpeg_tools import ffmpeg_exe, read_frames
+
+#frames sampled per second of video when not decoding key frames only
+SAMPLE_FPS = 1
+#frames whose 64-bit difference hashes are at most this many bits apart count as the same picture
+HASH_DISTANCE = 6
+#longest side and JPEG quality of the frames sent to the model
+MAX_SIDE = 768
+JPEG_QUALITY = 85
+#bitrate of the mono MP3 soundtrack sent along with the frames
+AUDIO_BITRATE = "32k"
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: one bit per horizontally adjacent pixel pair of a 9x8 grayscale thumbnail"""
+    pixels=list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    bits=0
+    for row in range(8):
+        for column in range(8):
+            bits=(bits<<1)|(pixels[row*9+column]>pixels[row*9+column+1])
+    return bits
+
+
+def keyframes(video_path: str, keyframes_only: bool = True, sample_fps: float = SAMPLE_FPS, max_distance: int = HASH_DISTANCE) -> list:
+    """Distinct frames of a video in order of appearance; frames close to one already kept are dropped.
+    The generated videos are still images per scene and x264 starts an I-frame at every scene cut, so decoding
+    only the I-frames finds every scene at a fraction of the cost; keyframes_only=False samples sample_fps instead."""
+    if keyframes_only:
+        reader=read_frames(video_path, input_params=["-skip_frame", "nokey"], output_params=["-fps_mode", "vfr"])
+    else:
+        reader=read_frames(video_path, output_params=["-vf", f"fps={sample_fps}"])
+    frames=[]
+    hashes=[]
+    for frame in reader:
+        frame_hash=dhash(frame)
+        if all(bin(frame_hash^kept).count("1")>max_distance for kept in hashes):
+            hashes.append(frame_hash)
+            frames.append(frame)
+    return frames
+
+
+def encode_jpeg(image: Image.Image, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> bytes:
+    image=image.copy()
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    buffer=io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def extract_audio(video_path: str, bitrate: str = AUDIO_BITRATE) -> bytes:
+    """The soundtrack (the voiceover) as a small mono MP3; empty if the video has no audio"""
+    command=[ffmpeg_exe(), "-loglevel", "error", "-i", video_path, "-vn", "-ac", "1", "-b:a", bitrate, "-f", "mp3", "pipe:1"]
+    return subprocess.run(command, check=True, capture_output=True).stdout
+
+
+def video_parts(video_path: str) -> list:
+    """Inline request parts standing in for the MP4: the distinct frames as JPEGs, then the soundtrack"""
+    parts=[{"mime_type": "image/jpeg", "data": encode_jpeg(frame)} for frame in keyframes(video_path)]
+    audio=extract_audio(video_path)
+    if audio:
+        parts.append({"mime_type": "audio/mp3", "data": audio})
+    return parts